@@ -1,6 +1,9 @@
 #!/usr/bin/env python3
 import os
-import requests
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.postgrest import get_session, grouped_counts
 
 # Supabase PostgreSQL connection details
 supabase_url = os.environ["SUPABASE_URL"].rstrip("/") + "/rest/v1"
@@ -13,9 +16,11 @@ headers = {
     "Prefer": "count=exact"
 }
 
+session = get_session()
+
 # Get total count with proper count header
 print("Getting total count...")
-response = requests.head(
+response = session.head(
     f"{supabase_url}/opere",
     headers=headers
 )
@@ -26,31 +31,18 @@ if response.status_code in [200, 206]:
         total_count = count_header.split('/')[-1]
         print(f"Total records: {total_count}")
 
-# Check type distribution
+# Check type distribution (counted server-side, one row per tipo)
 print("\nChecking type distribution...")
-response = requests.get(
-    f"{supabase_url}/opere",
-    headers=headers,
-    params={"select": "tipo", "limit": 50000}
-)
+type_counts = dict(grouped_counts("opere.tipo"))
+print(f"Counted {sum(type_counts.values())} records for analysis")
 
-if response.status_code == 200:
-    records = response.json()
-    print(f"Retrieved {len(records)} records for analysis")
-    
-    # Count by type
-    type_counts = {}
-    for record in records:
-        tipo = record.get('tipo', 'unknown')
-        type_counts[tipo] = type_counts.get(tipo, 0) + 1
-    
-    print("\nType distribution:")
-    for tipo, count in sorted(type_counts.items()):
-        print(f"  {tipo}: {count}")
+print("\nType distribution:")
+for tipo, count in sorted(type_counts.items()):
+    print(f"  {tipo}: {count}")
 
 # Check some non-series records from MySQL data
 print("\nLooking for films/documentaries in the data...")
-response = requests.get(
+response = session.get(
     f"{supabase_url}/opere",
     headers=headers,
     params={
@@ -68,7 +60,7 @@ if response.status_code == 200:
 
 # Check records without series info
 print("\nChecking records that should be films (no series details)...")
-response = requests.get(
+response = session.get(
     f"{supabase_url}/opere",
     headers=headers,
     params={
@@ -1,6 +1,9 @@
 #!/usr/bin/env python3
 import os
-import requests
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.postgrest import get_session
 
 # Supabase PostgreSQL connection details
 supabase_url = os.environ["SUPABASE_URL"].rstrip("/") + "/rest/v1"
@@ -13,8 +16,10 @@ headers = {
     "Prefer": "count=exact"
 }
 
+session = get_session()
+
 # Get count
-response = requests.get(
+response = session.get(
     f"{supabase_url}/artisti",
     headers=headers,
     params={"select": "codice_artista", "limit": 1000}
@@ -25,7 +30,7 @@ if response.status_code == 200:
     print(f"\nPostgreSQL artisti table contains {len(records)} records")
     
     # Get sample data
-    response = requests.get(
+    response = session.get(
         f"{supabase_url}/artisti",
         headers=headers,
         params={"limit": 10, "order": "codice_artista"}
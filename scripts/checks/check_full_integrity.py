@@ -1,7 +1,10 @@
 import os
-import requests
+import sys
 import json
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.postgrest import get_session, grouped_counts
+
 # Supabase PostgreSQL connection details
 supabase_url = os.environ["SUPABASE_URL"].rstrip("/") + "/rest/v1"
 supabase_key = os.environ["SUPABASE_SERVICE_ROLE_KEY"]
@@ -12,12 +15,14 @@ headers = {
     "Content-Type": "application/json"
 }
 
+session = get_session()
+
 def check_orphans_debug():
     print("Debugging orphans check...")
     
     # Replicate verify_partecipazioni_final.py logic
     print("  Checking orphans (artist is null) via select=count...")
-    response = requests.get(
+    response = session.get(
         f"{supabase_url}/partecipazioni",
         headers=headers,
         params={
@@ -32,7 +37,7 @@ def check_orphans_debug():
     
     # Try with valid PostgREST syntax for count
     print("  Checking orphans (artist is null) via Prefer: count=exact...")
-    response = requests.get(
+    response = session.get(
         f"{supabase_url}/partecipazioni",
         headers={**headers, "Prefer": "count=exact"},
         params={
@@ -50,47 +55,24 @@ def check_role_distribution_full():
     
     # Get roles
     roles_map = {}
-    r_resp = requests.get(f"{supabase_url}/ruoli_tipologie", headers=headers)
+    r_resp = session.get(f"{supabase_url}/ruoli_tipologie", headers=headers)
     if r_resp.status_code == 200:
         for r in r_resp.json():
             roles_map[r['id']] = r['nome']
     
-    total_count = 0
+    # One GROUP BY ruolo_id over partecipazioni: all roles, NULL included, in a single scan
+    counts = dict(grouped_counts("partecipazioni.ruolo_id"))
+    total_count = sum(counts.values())
     
-    # Count for each role
     for rid, rname in roles_map.items():
-        response = requests.get(
-            f"{supabase_url}/partecipazioni",
-            headers={**headers, "Prefer": "count=exact"},
-            params={
-                "select": "count", # Note: select=count isn't standard for count-only, but let's use head method or just limit=0
-                "ruolo_id": f"eq.{rid}",
-                "limit": 0
-            }
-        )
-        # Using HEAD is better for counting, but let's stick to GET with limit=0 and count=exact
-        cr = response.headers.get('content-range')
-        if cr:
-            count = int(cr.split('/')[-1])
-            print(f"  - {rname} ({rid}): {count}")
-            total_count += count
-        else:
-            print(f"  - {rname}: Failed to get count")
-
-    # Count NULL roles
-    response = requests.get(
-        f"{supabase_url}/partecipazioni",
-        headers={**headers, "Prefer": "count=exact"},
-        params={
-            "ruolo_id": "is.null",
-            "limit": 0
-        }
-    )
-    cr = response.headers.get('content-range')
-    if cr:
-        count = int(cr.split('/')[-1])
-        print(f"  - NULL ROLE: {count}")
-        total_count += count
+        print(f"  - {rname} ({rid}): {counts.get(rid, 0)}")
+    
+    # Role ids not (or no longer) in ruoli_tipologie
+    for rid, count in counts.items():
+        if rid is not None and rid not in roles_map:
+            print(f"  - UNKNOWN ROLE ({rid}): {count}")
+    
+    print(f"  - NULL ROLE: {counts.get(None, 0)}")
         
     print(f"Total counted: {total_count}")
 
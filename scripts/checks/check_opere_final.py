@@ -1,6 +1,9 @@
 #!/usr/bin/env python3
 import os
-import requests
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.postgrest import get_session, grouped_counts
 
 # Supabase PostgreSQL connection details
 supabase_url = os.environ["SUPABASE_URL"].rstrip("/") + "/rest/v1"
@@ -12,25 +15,23 @@ headers = {
     "Content-Type": "application/json"
 }
 
-# Get all records to get exact count
-response = requests.get(
+session = get_session()
+
+# Exact counts by type, computed server-side
+type_counts = dict(grouped_counts("opere.tipo"))
+print(f"Total records in PostgreSQL opere table: {sum(type_counts.values())}")
+print(f"Films: {type_counts.get('film', 0)}")
+print(f"TV Series: {type_counts.get('serie_tv', 0)}")
+
+# Show some sample records
+response = session.get(
     f"{supabase_url}/opere",
     headers=headers,
-    params={"select": "codice_opera,titolo,tipo,anno_produzione", "limit": 20000}
+    params={"select": "codice_opera,titolo,tipo,anno_produzione", "limit": 10}
 )
 
 if response.status_code == 200:
     records = response.json()
-    print(f"Total records in PostgreSQL opere table: {len(records)}")
-    
-    # Count by type
-    films = sum(1 for r in records if r.get('tipo') == 'film')
-    series = sum(1 for r in records if r.get('tipo') == 'serie_tv')
-    
-    print(f"Films: {films}")
-    print(f"TV Series: {series}")
-    
-    # Show some sample records
     print("\nSample records:")
     for i, record in enumerate(records[:10]):
         print(f"  {record.get('codice_opera')}: {record.get('titolo')} ({record.get('anno_produzione')}) - {record.get('tipo')}")
@@ -1,6 +1,9 @@
 #!/usr/bin/env python3
 import os
-import requests
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.postgrest import get_session
 
 # Supabase PostgreSQL connection details
 supabase_url = os.environ["SUPABASE_URL"].rstrip("/") + "/rest/v1"
@@ -12,10 +15,12 @@ headers = {
     "Content-Type": "application/json"
 }
 
+session = get_session()
+
 def check_ruoli_tipologie():
     """Verificare la tabella ruoli_tipologie"""
     try:
-        response = requests.get(
+        response = session.get(
             f"{supabase_url}/ruoli_tipologie",
             headers=headers,
             params={"limit": 10}
@@ -72,7 +77,7 @@ def create_ruoli_tipologie():
         created_ruoli = []
         
         for ruolo in ruoli_da_creare:
-            response = requests.post(
+            response = session.post(
                 f"{supabase_url}/ruoli_tipologie",
                 headers=headers,
                 json=ruolo
@@ -1,9 +1,12 @@
 #!/usr/bin/env python3
 import os
 import mysql.connector
-import requests
+import sys
 import json
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.postgrest import get_session
+
 # MySQL connection details
 mysql_config = {
     'host': '86.105.14.112',
@@ -22,6 +25,8 @@ headers = {
     "Content-Type": "application/json"
 }
 
+session = get_session()
+
 def explore_mysql_tables():
     """Esplorare le tabelle MySQL per trovare le relazioni artisti-opere"""
     try:
@@ -93,7 +98,7 @@ def check_supabase_partecipazioni():
         print(f"{'='*50}")
         
         # Verificare se la tabella esiste
-        response = requests.get(
+        response = session.get(
             f"{supabase_url}/partecipazioni",
             headers=headers,
             params={"limit": 1}
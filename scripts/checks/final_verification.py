@@ -1,6 +1,9 @@
 #!/usr/bin/env python3
 import os
-import requests
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.postgrest import get_session
 
 # Supabase PostgreSQL connection details
 supabase_url = os.environ["SUPABASE_URL"].rstrip("/") + "/rest/v1"
@@ -12,11 +15,13 @@ headers = {
     "Content-Type": "application/json"
 }
 
+session = get_session()
+
 # Get count for each type separately using exact count
 print("Getting exact counts by type...\n")
 
 # Count films
-response = requests.head(
+response = session.head(
     f"{supabase_url}/opere",
     headers={**headers, "Prefer": "count=exact"},
     params={"tipo": "eq.film"}
@@ -29,7 +34,7 @@ if response.status_code in [200, 206]:
         print(f"Films: {film_count}")
 
 # Count series
-response = requests.head(
+response = session.head(
     f"{supabase_url}/opere",
     headers={**headers, "Prefer": "count=exact"},
     params={"tipo": "eq.serie_tv"}
@@ -42,7 +47,7 @@ if response.status_code in [200, 206]:
         print(f"Serie TV: {series_count}")
 
 # Get total count
-response = requests.head(
+response = session.head(
     f"{supabase_url}/opere",
     headers={**headers, "Prefer": "count=exact"}
 )
@@ -55,7 +60,7 @@ if response.status_code in [200, 206]:
 
 # Sample of each type
 print("\nSample films:")
-response = requests.get(
+response = session.get(
     f"{supabase_url}/opere",
     headers=headers,
     params={"tipo": "eq.film", "select": "codice_opera,titolo,anno_produzione", "limit": 10}
@@ -67,7 +72,7 @@ if response.status_code == 200:
         print(f"  {film.get('codice_opera')}: {film.get('titolo')} ({film.get('anno_produzione')})")
 
 print("\nSample series:")
-response = requests.get(
+response = session.get(
     f"{supabase_url}/opere",
     headers=headers,
     params={"tipo": "eq.serie_tv", "select": "codice_opera,titolo,anno_produzione", "limit": 10}
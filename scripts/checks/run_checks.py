@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Esegue in parallelo i check di integrità di questa cartella e salva un report JSON.
+
+Ogni check gira in un proprio thread come se fosse lanciato da riga di
+comando (runpy, __name__ == "__main__"); il suo output viene catturato
+separatamente e riportato nel JSON con esito e durata. Tutti i check
+condividono la Session di common.postgrest con la cache delle letture
+attiva: una GET identica (stessa URL, parametri e Prefer/Range) o una RPC di
+sola lettura (READ_ONLY_RPCS, es. grouped_counts) fatta da più check viene
+inviata a Supabase una sola volta per esecuzione.
+Il runner è di sola verifica: gli script che scrivono (WRITING_CHECKS) non
+vengono mai eseguiti.
+"""
+
+import os
+import sys
+import io
+import json
+import time
+import runpy
+import argparse
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.checkpoint import STATE_DIR
+from common.postgrest import enable_read_cache, ensure_pool_size, get_session
+
+CHECKS_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_REPORT_PATH = os.path.join(STATE_DIR, "checks_report.json")
+# Check che leggono anche da MySQL: esclusi salvo richiesta esplicita
+MYSQL_CHECKS = {"explore_partecipazioni"}
+# Script che modificano il database (check_ruoli_tipologie crea i ruoli se mancano)
+WRITING_CHECKS = {"check_ruoli_tipologie"}
+
+
+class ThreadOutput(io.TextIOBase):
+    """sys.stdout che scrive nel buffer del thread corrente, se ne ha uno"""
+
+    def __init__(self, fallback):
+        self.fallback = fallback
+        self.local = threading.local()
+
+    def capture(self):
+        self.local.buffer = io.StringIO()
+        return self.local.buffer
+
+    def release(self):
+        buffer = self.local.buffer
+        self.local.buffer = None
+        return buffer.getvalue()
+
+    def write(self, text):
+        buffer = getattr(self.local, "buffer", None)
+        return (buffer or self.fallback).write(text)
+
+    def flush(self):
+        if getattr(self.local, "buffer", None) is None:
+            self.fallback.flush()
+
+
+def available_checks():
+    return sorted(
+        name[:-3] for name in os.listdir(CHECKS_DIR)
+        if name.endswith(".py") and name != os.path.basename(__file__) and name[:-3] not in WRITING_CHECKS
+    )
+
+
+def run_check(name, output):
+    """Esegue un check e ne restituisce esito, durata e output catturato"""
+    output.capture()
+    status, error = "ok", None
+    started = time.monotonic()
+    try:
+        runpy.run_path(os.path.join(CHECKS_DIR, f"{name}.py"), run_name="__main__")
+    except SystemExit as e:
+        if e.code not in (None, 0):
+            status, error = "failed", f"exit code {e.code}"
+    except Exception:
+        status, error = "error", traceback.format_exc()
+    duration = time.monotonic() - started
+
+    return {
+        "name": name,
+        "status": status,
+        "duration_s": round(duration, 3),
+        "output": output.release(),
+        "error": error,
+    }
+
+
+if __name__ == "__main__":
+    checks = available_checks()
+    parser = argparse.ArgumentParser(description="Esegue i check di integrità in parallelo con report JSON")
+    parser.add_argument("checks", nargs="*", metavar="CHECK",
+                        help=f"check da eseguire: {', '.join(checks)} "
+                             f"(default: tutti tranne {', '.join(sorted(MYSQL_CHECKS))})")
+    parser.add_argument("--exclude", nargs="*", default=[], metavar="CHECK", help="check da saltare")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="check eseguiti contemporaneamente (default: tutti)")
+    parser.add_argument("--report", default=DEFAULT_REPORT_PATH,
+                        help="file del report JSON (default: %(default)s)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="non condividere le letture identiche tra i check")
+    args = parser.parse_args()
+    writing = [name for name in args.checks if name in WRITING_CHECKS]
+    if writing:
+        parser.error(f"{', '.join(writing)} modifica il database: eseguirlo a parte")
+    unknown = [name for name in args.checks + args.exclude if name not in checks]
+    if unknown:
+        parser.error(f"check sconosciuti: {', '.join(unknown)}")
+
+    selected = args.checks or [name for name in checks if name not in MYSQL_CHECKS]
+    selected = [name for name in selected if name not in args.exclude]
+    workers = max(1, args.workers or len(selected))
+
+    ensure_pool_size(get_session(), workers)
+    cache = None if args.no_cache else enable_read_cache()
+
+    output = ThreadOutput(sys.stdout)
+    sys.stdout = output
+    started_at = datetime.now(timezone.utc)
+    started = time.monotonic()
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(lambda name: run_check(name, output), selected))
+    finally:
+        sys.stdout = output.fallback
+    duration = time.monotonic() - started
+
+    report = {
+        "started_at": started_at.isoformat(),
+        "duration_s": round(duration, 3),
+        "workers": workers,
+        "cache": {"hits": cache.hits, "misses": cache.misses, "invalidations": cache.invalidations} if cache else None,
+        "checks": results,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.report)), exist_ok=True)
+    with open(args.report, "w") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+
+    for result in results:
+        icon = "✅" if result["status"] == "ok" else "❌"
+        print(f"{icon} {result['name']:<30} {result['duration_s']:>8.2f}s")
+        if result["error"]:
+            print(f"   {result['error'].strip().splitlines()[-1]}")
+    if cache:
+        print(f"\n📊 Cache letture: {cache.hits} riusate, {cache.misses} inviate")
+    print(f"⏱️  Totale: {duration:.2f}s con {workers} check in parallelo")
+    print(f"📄 Report: {args.report}")
+
+    sys.exit(0 if all(result["status"] == "ok" for result in results) else 1)
@@ -1,6 +1,9 @@
 #!/usr/bin/env python3
 import os
-import requests
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.postgrest import get_session, grouped_counts
 
 # Supabase PostgreSQL connection details
 supabase_url = os.environ["SUPABASE_URL"].rstrip("/") + "/rest/v1"
@@ -12,11 +15,13 @@ headers = {
     "Content-Type": "application/json"
 }
 
+session = get_session()
+
 def verify_final_partecipazioni():
     """Verifica finale completa delle partecipazioni"""
     try:
         # Conteggio totale
-        response = requests.head(
+        response = session.head(
             f"{supabase_url}/partecipazioni",
             headers={**headers, "Prefer": "count=exact"}
         )
@@ -27,30 +32,15 @@ def verify_final_partecipazioni():
                 total_count = count_header.split('/')[-1]
                 print(f"📊 Totale partecipazioni: {total_count}")
         
-        # Distribuzione per ruolo
+        # Distribuzione per ruolo (conteggio lato server su tutte le partecipazioni)
         print("\n📋 Distribuzione per ruolo:")
-        response = requests.get(
-            f"{supabase_url}/partecipazioni",
-            headers=headers,
-            params={
-                "select": "ruoli_tipologie(nome)",
-                "limit": 20000
-            }
-        )
-        
-        if response.status_code == 200:
-            partecipazioni = response.json()
-            ruoli_count = {}
-            for p in partecipazioni:
-                ruolo_nome = p.get('ruoli_tipologie', {}).get('nome', 'Sconosciuto')
-                ruoli_count[ruolo_nome] = ruoli_count.get(ruolo_nome, 0) + 1
-            
-            for ruolo, count in sorted(ruoli_count.items()):
-                print(f"  • {ruolo}: {count}")
+        ruoli_count = dict(grouped_counts("partecipazioni.ruolo"))
+        for ruolo, count in sorted(ruoli_count.items()):
+            print(f"  • {ruolo}: {count}")
         
         # Esempi di partecipazioni con relazioni
         print("\n🎭 Esempi di partecipazioni:")
-        response = requests.get(
+        response = session.get(
             f"{supabase_url}/partecipazioni",
             headers=headers,
             params={
@@ -79,7 +69,7 @@ def verify_final_partecipazioni():
         print("\n🔗 Verifica integrità relazioni:")
         
         # Partecipazioni senza artista
-        response = requests.get(
+        response = session.get(
             f"{supabase_url}/partecipazioni",
             headers=headers,
             params={
@@ -98,7 +88,7 @@ def verify_final_partecipazioni():
             print(f"  • Partecipazioni senza artista: {orphaned}")
         
         # Partecipazioni senza opera
-        response = requests.get(
+        response = session.get(
             f"{supabase_url}/partecipazioni",
             headers=headers,
             params={
@@ -117,26 +107,9 @@ def verify_final_partecipazioni():
         
         # Statistiche per opera più popolare
         print("\n🏆 Top 5 opere con più partecipazioni:")
-        response = requests.get(
-            f"{supabase_url}/partecipazioni",
-            headers=headers,
-            params={
-                "select": "opere(titolo)",
-                "limit": 5000
-            }
-        )
-        
-        if response.status_code == 200:
-            partecipazioni = response.json()
-            opere_count = {}
-            for p in partecipazioni:
-                titolo = p.get('opere', {}).get('titolo', 'N/A')
-                opere_count[titolo] = opere_count.get(titolo, 0) + 1
-            
-            # Ordinare per numero di partecipazioni
-            top_opere = sorted(opere_count.items(), key=lambda x: x[1], reverse=True)[:5]
-            for i, (titolo, count) in enumerate(top_opere, 1):
-                print(f"  {i}. {titolo}: {count} partecipazioni")
+        top_opere = grouped_counts("partecipazioni.opera", limit=5)
+        for i, (titolo, count) in enumerate(top_opere, 1):
+            print(f"  {i}. {titolo}: {count} partecipazioni")
         
         return True
         
@@ -0,0 +1 @@
+"""Moduli condivisi dagli script Python di migrazione e verifica (scripts/)."""
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Dimensionamento adattivo dei batch PostgREST.
+
+AdaptiveBatchSize parte da una dimensione iniziale e la fa crescere finché
+le richieste restano veloci, limitandola in base ai byte serializzati per
+riga. send_adaptive invia un batch e, se il server risponde 413 o va in
+timeout, lo dimezza e ritenta le stesse righe invece di scartarle: ogni
+tabella converge così al batch più grande che il server tollera.
+"""
+
+import threading
+import time
+import requests
+
+# Codice Postgres di "canceling statement due to statement timeout"
+STATEMENT_TIMEOUT_CODE = "57014"
+
+
+class AdaptiveBatchSize:
+    def __init__(self, initial=50, min_size=1, max_size=5000, max_bytes=1_000_000, target_latency=2.0):
+        """
+        max_bytes: limite del payload serializzato (body + URL) per richiesta
+        target_latency: secondi oltre i quali il batch smette di crescere
+        """
+        self.min_size = min_size
+        self.max_size = max_size
+        self.max_bytes = max_bytes
+        self.target_latency = target_latency
+        self._size = max(min_size, min(initial, max_size))
+        self._row_bytes = None
+        # Dimensione più piccola rifiutata dal server: la crescita non la raggiunge più
+        self._ceiling = max_size
+        self._lock = threading.Lock()
+
+    @property
+    def size(self):
+        with self._lock:
+            return self._size
+
+    def record_success(self, rows, nbytes, latency):
+        """Aggiorna la dimensione dopo un batch accettato in latency secondi"""
+        with self._lock:
+            row_bytes = nbytes / max(rows, 1)
+            self._row_bytes = row_bytes if self._row_bytes is None else 0.8 * self._row_bytes + 0.2 * row_bytes
+
+            if latency > 2 * self.target_latency:
+                self._size = int(self._size * 0.75)
+            elif latency <= self.target_latency and rows >= self._size:
+                self._size = int(self._size * 1.5) + 1
+
+            byte_cap = int(self.max_bytes / self._row_bytes) if self._row_bytes else self.max_size
+            self._size = max(self.min_size, min(self._size, self._ceiling, byte_cap))
+
+    def record_too_large(self, rows):
+        """Dimezza la dimensione dopo un 413 o un timeout su un batch di rows righe"""
+        with self._lock:
+            self._ceiling = max(self.min_size, min(self._ceiling, rows - 1))
+            self._size = max(self.min_size, min(self._size, rows // 2))
+
+
+def is_batch_too_large(response):
+    """True se la risposta indica payload troppo grande o statement timeout"""
+    if response.status_code in [408, 413, 414, 504]:
+        return True
+    return response.status_code == 500 and STATEMENT_TIMEOUT_CODE in response.text
+
+
+def request_size(response):
+    """Byte inviati dalla richiesta che ha prodotto response (body + URL)"""
+    body = response.request.body or b""
+    return len(body) + len(response.request.url)
+
+
+def sized_batches(records, sizer):
+    """Raggruppa un iterabile di record in liste della dimensione corrente di sizer"""
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= sizer.size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def send_adaptive(batch, sizer, send):
+    """
+    Invia batch con send(batch) -> Response. Su 413/timeout dimezza il batch e
+    ritenta le due metà. Restituisce una lista di (sotto_batch, response, errore)
+    per ogni richiesta conclusiva; errore è None se il sotto-batch è stato accettato.
+    """
+    start = time.monotonic()
+    try:
+        response = send(batch)
+    except requests.Timeout as e:
+        response, timeout = None, e
+    except Exception as e:
+        return [(batch, None, str(e))]
+    latency = time.monotonic() - start
+
+    if response is not None and response.ok:
+        sizer.record_success(len(batch), request_size(response), latency)
+        return [(batch, response, None)]
+
+    if (response is None or is_batch_too_large(response)) and len(batch) > 1:
+        sizer.record_too_large(len(batch))
+        mid = len(batch) // 2
+        return send_adaptive(batch[:mid], sizer, send) + send_adaptive(batch[mid:], sizer, send)
+
+    error = str(timeout) if response is None else f"{response.status_code} - {response.text}"
+    return [(batch, response, error)]
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Checkpoint su file per le migrazioni riprendibili.
+
+Ogni script di migrazione salva in scripts/.state/<nome>.checkpoint.json la
+chiave più alta (cod_artista, cod_opera, idRel) fino alla quale tutti i
+batch sono stati confermati da Supabase, insieme ai conteggi. Con --resume
+l'estrazione riparte da WHERE chiave > last_key.
+"""
+
+import json
+import os
+from datetime import datetime
+
+STATE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".state")
+
+
+class Checkpoint:
+    def __init__(self, name, key_column):
+        self.name = name
+        self.key_column = key_column
+        self.path = os.path.join(STATE_DIR, f"{name}.checkpoint.json")
+
+    def load(self):
+        """Restituisce lo stato salvato, o None se non esiste un checkpoint"""
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path) as f:
+            return json.load(f)
+
+    def save(self, last_key, **counts):
+        """Scrive lo stato in modo atomico (file temporaneo + rename)"""
+        os.makedirs(STATE_DIR, exist_ok=True)
+        state = {
+            "key_column": self.key_column,
+            "last_key": last_key,
+            **counts,
+            "updated_at": datetime.now().isoformat(timespec="seconds")
+        }
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.path)
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def resume_key(self):
+        """Chiave da cui riprendere (None se non c'è nulla da riprendere) e stato salvato"""
+        state = self.load()
+        if not state:
+            return None, {}
+        return state.get("last_key"), state
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Fingerprint dei record per la sincronizzazione incrementale (delta).
+
+FingerprintStore conserva in scripts/.state/<nome>.fingerprints.sqlite un
+hash per ogni record mappato (il dict inviato a Supabase), indicizzato per
+codice sorgente. changed() lascia passare solo i record nuovi o modificati
+rispetto all'ultimo sync; commit() registra gli hash solo dopo che il
+batch è stato confermato, così un run interrotto rinvia le righe mancanti.
+Gli hash valgono solo finché la riga esiste in PostgreSQL: prima di ogni
+delta retain() scarta quelli dei codici non più presenti (righe eliminate da
+altri script), così vengono reinviati invece di restare mancanti per sempre.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+
+from common.checkpoint import STATE_DIR
+
+
+def record_fingerprint(record):
+    """Hash stabile di un record (indipendente dall'ordine delle chiavi)"""
+    payload = json.dumps(record, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.blake2b(payload.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class FingerprintStore:
+    def __init__(self, name, key_field):
+        os.makedirs(STATE_DIR, exist_ok=True)
+        self.key_field = key_field
+        self.path = os.path.join(STATE_DIR, f"{name}.fingerprints.sqlite")
+        # Scritto dai thread dell'uploader: accesso serializzato dal lock
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS fingerprints (key TEXT PRIMARY KEY, hash TEXT NOT NULL)")
+        self._lock = threading.Lock()
+        self._pending = {}
+        self.unchanged = 0
+        self.changed_count = 0
+
+    def changed(self, records):
+        """Genera solo i record nuovi o modificati dall'ultimo sync confermato"""
+        for record in records:
+            key = str(record[self.key_field])
+            fingerprint = record_fingerprint(record)
+            with self._lock:
+                row = self._conn.execute("SELECT hash FROM fingerprints WHERE key = ?", (key,)).fetchone()
+                if row and row[0] == fingerprint:
+                    self.unchanged += 1
+                    continue
+                self._pending[key] = fingerprint
+                self.changed_count += 1
+            yield record
+
+    def retain(self, keys):
+        """Tiene solo gli hash dei codici in keys (presenti in PostgreSQL); restituisce quanti ne scarta"""
+        with self._lock:
+            self._conn.execute("CREATE TEMP TABLE IF NOT EXISTS present (key TEXT PRIMARY KEY)")
+            self._conn.execute("DELETE FROM present")
+            self._conn.executemany("INSERT OR IGNORE INTO present (key) VALUES (?)",
+                                   ((str(key),) for key in keys))
+            dropped = self._conn.execute(
+                "DELETE FROM fingerprints WHERE key NOT IN (SELECT key FROM present)"
+            ).rowcount
+            self._conn.execute("DELETE FROM present")
+            self._conn.commit()
+            return dropped
+
+    def commit(self, records=None):
+        """Registra gli hash dei record confermati (tutti quelli in sospeso se records è None)"""
+        with self._lock:
+            if records is None:
+                keys = list(self._pending)
+            else:
+                keys = [str(record[self.key_field]) for record in records]
+            rows = [(key, self._pending.pop(key)) for key in keys if key in self._pending]
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO fingerprints (key, hash) VALUES (?, ?)",
+                rows
+            )
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def print_summary(self):
+        print(f"Delta: {self.changed_count} record nuovi o modificati, {self.unchanged} invariati")
+        if self._pending:
+            print(f"   ⚠️  {len(self._pending)} record non confermati: verranno reinviati al prossimo sync")
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Insiemi compatti di ID interi per i confronti MySQL / PostgreSQL.
+
+IdSet memorizza gli ID non negativi come bitmap (1 bit per valore possibile)
+invece che come set di oggetti int: qualche MB anche per decine di milioni di
+ID densi. Differenza, intersezione e filtro per intervallo sono operazioni
+bit a bit sull'intera bitmap (int di Python), quindi eseguite in C.
+
+La bitmap copre 0..ID massimo qualunque sia il numero di ID, quindi un solo
+ID anomalo (es. un metadati->>'id_opera_staging' errato) la farebbe crescere
+a dismisura: gli ID oltre MAX_ID (bitmap da 64 MB) sono rifiutati con
+ValueError invece di allocare.
+"""
+
+import re
+
+_NONZERO = re.compile(rb"[^\x00]")
+
+MAX_ID = (1 << 29) - 1
+
+
+def _check_id(id):
+    if id < 0:
+        raise ValueError(f"IdSet accetta solo ID non negativi: {id}")
+    if id > MAX_ID:
+        raise ValueError(f"ID {id} oltre il limite di IdSet ({MAX_ID}): "
+                         f"probabilmente un valore errato nei dati di origine")
+
+
+class IdSet:
+    def __init__(self, ids=()):
+        self._buf = bytearray()
+        self.update(ids)
+
+    @classmethod
+    def _from_int(cls, bits):
+        idset = cls()
+        idset._buf = bytearray(bits.to_bytes((bits.bit_length() + 7) // 8, "little"))
+        return idset
+
+    def _int(self):
+        return int.from_bytes(self._buf, "little")
+
+    def add(self, id):
+        index = id >> 3
+        if index >= len(self._buf) or id < 0:
+            _check_id(id)
+            # Crescita geometrica: gli ID arrivano in ordine crescente
+            self._buf.extend(bytes(max(index + 1 - len(self._buf), len(self._buf))))
+        self._buf[index] |= 1 << (id & 7)
+
+    def update(self, ids):
+        """add() per molti ID, con il ciclo in variabili locali"""
+        buf = self._buf
+        size = len(buf)
+        for id in ids:
+            index = id >> 3
+            if index >= size or id < 0:
+                _check_id(id)
+                buf.extend(bytes(max(index + 1 - size, size)))
+                size = len(buf)
+            buf[index] |= 1 << (id & 7)
+
+    def __contains__(self, id):
+        index = id >> 3
+        return 0 <= id and index < len(self._buf) and bool(self._buf[index] >> (id & 7) & 1)
+
+    def __len__(self):
+        return self._int().bit_count()
+
+    def __bool__(self):
+        return any(self._buf)
+
+    def __iter__(self):
+        """ID in ordine crescente; i byte a zero sono saltati dalla regex"""
+        for match in _NONZERO.finditer(self._buf):
+            byte, base = self._buf[match.start()], match.start() << 3
+            for bit in range(8):
+                if byte >> bit & 1:
+                    yield base + bit
+
+    def __sub__(self, other):
+        return IdSet._from_int(self._int() & ~other._int())
+
+    def __and__(self, other):
+        return IdSet._from_int(self._int() & other._int())
+
+    def __or__(self, other):
+        return IdSet._from_int(self._int() | other._int())
+
+    def upto(self, max_id):
+        """Sottoinsieme degli ID <= max_id"""
+        return IdSet._from_int(self._int() & ((1 << (max_id + 1)) - 1))
+
+    def min(self):
+        bits = self._int()
+        if not bits:
+            raise ValueError("IdSet vuoto")
+        return (bits & -bits).bit_length() - 1
+
+    def max(self):
+        bits = self._int()
+        if not bits:
+            raise ValueError("IdSet vuoto")
+        return bits.bit_length() - 1
+
+    def to_bytes(self):
+        """Bitmap serializzata (little-endian, senza byte a zero finali)"""
+        return bytes(self._buf).rstrip(b"\x00")
+
+    @classmethod
+    def from_bytes(cls, data):
+        idset = cls()
+        idset._buf = bytearray(data)
+        return idset
+
+    @property
+    def nbytes(self):
+        return len(self._buf)
@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+"""
+Estrazione in streaming da MySQL per gli script di migrazione.
+
+iter_batches esegue la query su un cursore non bufferizzato e restituisce le
+righe a blocchi con fetchmany: l'intera tabella non viene mai caricata in
+memoria e il primo blocco è disponibile appena MySQL inizia a inviare righe.
+"""
+
+import mysql.connector
+
+
+def iter_batches(mysql_config, query, params=None, batch_size=1000, dictionary=True):
+    """
+    Genera liste di al massimo batch_size righe lette in streaming da query.
+    La connessione è dedicata al generatore e viene chiusa al termine.
+    """
+    conn = mysql.connector.connect(**mysql_config)
+    cursor = conn.cursor(dictionary=dictionary, buffered=False)
+    exhausted = False
+
+    try:
+        cursor.execute(query, params)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                exhausted = True
+                break
+            yield rows
+    finally:
+        if exhausted:
+            cursor.close()
+            conn.close()
+        else:
+            # Con righe ancora da leggere close() fallirebbe ("Unread result found"):
+            # si chiude direttamente il socket senza drenare il resto della tabella
+            conn.shutdown()
@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+"""
+Classificazione film / serie_tv delle opere MySQL, condivisa dagli script.
+
+Un'opera è una serie se ha almeno un dato di stagione o episodio. Il
+predicato esiste solo qui, come espressione SQL: MySQL lo valuta sull'intera
+tabella in un solo passaggio e restituisce solo (cod_opera, is_series), così
+analyze_mysql_data, fix_postgresql_types e quick_fix_types ottengono
+esattamente la stessa classificazione senza valutarla riga per riga in Python.
+"""
+
+from common.mysql_stream import iter_batches
+
+SERIES_PREDICATE_SQL = """(
+    (stagione IS NOT NULL AND stagione != '')
+    OR (nStagione IS NOT NULL AND nStagione > 0)
+    OR (episodio IS NOT NULL AND episodio != '')
+    OR (nEpisodio IS NOT NULL AND nEpisodio > 0)
+    OR (titoloEpisodio IS NOT NULL AND titoloEpisodio != '')
+)"""
+
+TIPO_SQL = f"CASE WHEN {SERIES_PREDICATE_SQL} THEN 'serie_tv' ELSE 'film' END"
+
+
+def classify_opere(mysql_config, batch_size=50000):
+    """
+    Classifica l'intero catalogo: restituisce (cod_opera dei film, cod_opera
+    delle serie), in ordine di cod_opera.
+    """
+    films, series = [], []
+    query = f"SELECT cod_opera, {SERIES_PREDICATE_SQL} AS is_series FROM opere ORDER BY cod_opera"
+    for rows in iter_batches(mysql_config, query, batch_size=batch_size, dictionary=False):
+        for cod_opera, is_series in rows:
+            (series if is_series else films).append(cod_opera)
+    return films, series
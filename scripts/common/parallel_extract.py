@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Estrazione MySQL parallela per intervalli di chiave primaria.
+
+iter_sharded divide l'intervallo [MIN(key), MAX(key)] in tanti shard quanti
+sono i worker; ogni shard viene letto in streaming e trasformato in un
+processo separato, con la propria connessione MySQL. I batch trasformati
+arrivano al processo principale (che li passa al loader condiviso) tramite
+una coda limitata, quindi la memoria resta costante.
+
+L'ordine dei batch tra shard diversi non è garantito: il chiamante non può
+usarli per un checkpoint basato su una sola chiave massima.
+"""
+
+import multiprocessing
+import mysql.connector
+
+from common.mysql_stream import iter_batches
+
+_SHARD_DONE = "__shard_done__"
+
+
+def key_bounds(mysql_config, table, key, after=None):
+    """(MIN(key), MAX(key)) della tabella, opzionalmente solo oltre after"""
+    conn = mysql.connector.connect(**mysql_config)
+    cursor = conn.cursor()
+    try:
+        if after is None:
+            cursor.execute(f"SELECT MIN({key}), MAX({key}) FROM {table}")
+        else:
+            cursor.execute(f"SELECT MIN({key}), MAX({key}) FROM {table} WHERE {key} > %s", (after,))
+        return cursor.fetchone()
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def split_range(lo, hi, shards):
+    """Divide [lo, hi] in al massimo shards intervalli semiaperti [start, end)"""
+    step = max(1, (hi - lo + shards) // shards)
+    ranges = []
+    start = lo
+    while start <= hi:
+        end = min(start + step, hi + 1)
+        ranges.append((start, end))
+        start = end
+    return ranges
+
+
+def _extract_shard(mysql_config, query, params, key, transform, batch_size, out):
+    try:
+        for rows in iter_batches(mysql_config, query, params, batch_size=batch_size):
+            out.put([(row[key], transform(row)) for row in rows])
+        out.put(_SHARD_DONE)
+    except Exception as e:
+        out.put(RuntimeError(f"shard {params}: {e}"))
+
+
+def iter_sharded(mysql_config, table, key, transform, workers, columns="*", batch_size=1000):
+    """
+    Genera liste di (chiave, transform(riga)) estratte da workers processi.
+    transform deve essere una funzione di modulo (o un functools.partial) per
+    poter essere eseguita nei processi figli.
+    """
+    lo, hi = key_bounds(mysql_config, table, key)
+    if lo is None:
+        return
+
+    ranges = split_range(lo, hi, workers)
+    print(f"   🔀 Estrazione {table} in {len(ranges)} shard su {key} [{lo}, {hi}]")
+
+    out = multiprocessing.Queue(maxsize=len(ranges) * 4)
+    query = f"SELECT {columns} FROM {table} WHERE {key} >= %s AND {key} < %s ORDER BY {key}"
+    processes = [
+        multiprocessing.Process(
+            target=_extract_shard,
+            args=(mysql_config, query, (start, end), key, transform, batch_size, out),
+            daemon=True
+        )
+        for start, end in ranges
+    ]
+    for process in processes:
+        process.start()
+
+    finished = 0
+    try:
+        while finished < len(processes):
+            item = out.get()
+            if isinstance(item, Exception):
+                raise item
+            if item == _SHARD_DONE:
+                finished += 1
+                continue
+            yield item
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+            process.join()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Backend di caricamento diretto su PostgreSQL con COPY.
+
+In alternativa ai batch JSON via PostgREST, copy_records si collega al
+database (SUPABASE_DB_URL o --db-url), copia i record in streaming con
+COPY ... FROM STDIN in una tabella di staging temporanea e li fonde nella
+tabella finale con un solo INSERT ... SELECT, tutto in una transazione.
+Richiede psycopg 3 (pip install "psycopg[binary]"); funziona anche contro
+un Postgres locale con lo schema di db/init.
+"""
+
+import os
+
+try:
+    import psycopg
+    from psycopg import sql
+    from psycopg.types.json import Jsonb
+except ImportError:
+    psycopg = None
+
+PROGRESS_EVERY = 50000
+
+
+def default_db_url():
+    """Connection string Postgres dalle variabili d'ambiente (None se assente)"""
+    return os.environ.get("SUPABASE_DB_URL") or os.environ.get("DATABASE_URL")
+
+
+def _copy_value(value):
+    """I dict dei record (es. dettagli_serie) vanno in colonne jsonb come oggetti, come via PostgREST"""
+    return Jsonb(value) if isinstance(value, dict) else value
+
+
+def copy_records(dsn, table, columns, keyed_records, conflict_key=None, ignore_duplicates=False):
+    """
+    Carica keyed_records, iterabile di (chiave_sorgente, record), in public.<table>.
+    Solo le colonne in columns vengono copiate. Con conflict_key (una colonna o
+    una lista) le righe già presenti vengono aggiornate (ON CONFLICT DO UPDATE)
+    invece di duplicate, o saltate (DO NOTHING) con ignore_duplicates.
+    Restituisce (righe copiate, righe scritte, ultima chiave sorgente).
+    """
+    if psycopg is None:
+        raise RuntimeError("Il backend COPY richiede psycopg 3: pip install \"psycopg[binary]\"")
+    if not dsn:
+        raise RuntimeError("Connection string Postgres mancante: impostare SUPABASE_DB_URL o --db-url")
+
+    staging = sql.Identifier(f"_copy_{table}")
+    target = sql.Identifier("public", table)
+    cols = sql.SQL(", ").join(sql.Identifier(c) for c in columns)
+
+    merge = sql.SQL("INSERT INTO {target} ({cols}) SELECT {cols} FROM {staging}").format(
+        target=target, cols=cols, staging=staging
+    )
+    if conflict_key:
+        key_columns = [conflict_key] if isinstance(conflict_key, str) else list(conflict_key)
+        key = sql.SQL(", ").join(sql.Identifier(c) for c in key_columns)
+        if ignore_duplicates:
+            merge += sql.SQL(" ON CONFLICT ({key}) DO NOTHING").format(key=key)
+        else:
+            updates = sql.SQL(", ").join(
+                sql.SQL("{c} = EXCLUDED.{c}").format(c=sql.Identifier(c))
+                for c in columns if c not in key_columns
+            )
+            merge += sql.SQL(" ON CONFLICT ({key}) DO UPDATE SET {updates}").format(
+                key=key, updates=updates
+            )
+
+    copied = 0
+    last_key = None
+
+    # Il context manager della connessione fa commit all'uscita, rollback su eccezione
+    with psycopg.connect(dsn) as conn:
+        with conn.cursor() as cur:
+            cur.execute(sql.SQL(
+                "CREATE TEMP TABLE {staging} (LIKE {target} INCLUDING DEFAULTS) ON COMMIT DROP"
+            ).format(staging=staging, target=target))
+
+            copy_sql = sql.SQL("COPY {staging} ({cols}) FROM STDIN").format(staging=staging, cols=cols)
+            with cur.copy(copy_sql) as copy:
+                for key, record in keyed_records:
+                    copy.write_row([_copy_value(record.get(c)) for c in columns])
+                    copied += 1
+                    last_key = key
+                    if copied % PROGRESS_EVERY == 0:
+                        print(f"   📤 Copiati {copied} record in staging...")
+
+            print(f"   🔀 Merge di {copied} record in {table}...")
+            cur.execute(merge)
+            written = cur.rowcount
+
+    return copied, written, last_key
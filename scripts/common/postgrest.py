@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""
+Client PostgREST condiviso dagli script sotto scripts/.
+
+Tutte le chiamate REST verso Supabase passano da una sola requests.Session
+con pool di connessioni keep-alive: i migliaia di batch di una migrazione
+riusano le stesse connessioni TCP/TLS invece di rifare l'handshake a ogni
+richiesta. La dimensione del pool si configura con SUPABASE_POOL_SIZE.
+Ogni richiesta passa dal rate limiter adattivo di common.ratelimit, che
+ritenta le risposte 429/503 dopo il Retry-After indicato dal server.
+Con enable_read_cache() le letture identiche (GET/HEAD e RPC di sola lettura
+in READ_ONLY_RPCS) vengono eseguite una sola volta per processo (usato dal
+runner dei check); ogni altra richiesta svuota la cache.
+"""
+
+import json
+import os
+import threading
+from concurrent.futures import Future
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from common.ratelimit import THROTTLE_STATUSES, TokenBucketLimiter, parse_retry_after
+
+DEFAULT_POOL_SIZE = int(os.environ.get("SUPABASE_POOL_SIZE", "10"))
+MAX_THROTTLE_RETRIES = 5
+
+# RPC senza effetti collaterali: con la cache attiva le POST identiche vengono riusate
+READ_ONLY_RPCS = frozenset({"grouped_counts"})
+
+_session = None
+
+
+def rest_url():
+    """URL base dell'API REST di Supabase (.../rest/v1)"""
+    return os.environ["SUPABASE_URL"].rstrip("/") + "/rest/v1"
+
+
+def service_headers(**extra):
+    """Header di autenticazione con la service role key, più eventuali extra"""
+    key = os.environ["SUPABASE_SERVICE_ROLE_KEY"]
+    return {
+        "apikey": key,
+        "Authorization": f"Bearer {key}",
+        "Content-Type": "application/json",
+        **extra
+    }
+
+
+def mount_pool(session, pool_size):
+    """Monta sulla session un HTTPAdapter con pool di pool_size connessioni"""
+    adapter = HTTPAdapter(
+        pool_connections=pool_size,
+        pool_maxsize=pool_size,
+        pool_block=True
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.pool_size = pool_size
+
+
+def ensure_pool_size(session, pool_size):
+    """Allarga il pool se più thread del previsto useranno la session insieme"""
+    if getattr(session, "pool_size", 0) < pool_size:
+        mount_pool(session, pool_size)
+
+
+class ReadCache:
+    """
+    Cache delle letture identiche condivisa tra thread: la prima richiesta per
+    una chiave viene inviata, quelle concorrenti o successive ne attendono e
+    riusano la risposta. Le risposte non 2xx non restano in cache e ogni
+    scrittura la svuota (invalidate), così nessuna lettura successiva vede
+    dati precedenti alla scrittura.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def is_read(method, url):
+        """True per GET/HEAD e per le POST alle RPC in READ_ONLY_RPCS"""
+        method = method.upper()
+        if method in ("GET", "HEAD"):
+            return True
+        path = requests.utils.urlparse(url).path
+        return method == "POST" and "/rpc/" in path and path.rsplit("/rpc/", 1)[1] in READ_ONLY_RPCS
+
+    @staticmethod
+    def key(method, url, kwargs):
+        params = kwargs.get("params")
+        if isinstance(params, dict):
+            params = sorted(params.items())
+        full_url = requests.Request(method, url, params=params).prepare().url
+        headers = kwargs.get("headers") or {}
+        # Solo gli header che cambiano il contenuto della risposta
+        varying = tuple((name, headers.get(name)) for name in ("Prefer", "Range", "Accept"))
+        body = json.dumps(kwargs.get("json"), sort_keys=True, default=str)
+        return method.upper(), full_url, varying, body
+
+    def invalidate(self):
+        """Dimentica tutte le risposte (le richieste già in volo restano ai thread che le attendono)"""
+        with self._lock:
+            self._entries.clear()
+            self.invalidations += 1
+
+    def _forget(self, key, future):
+        with self._lock:
+            if self._entries.get(key) is future:
+                del self._entries[key]
+
+    def fetch(self, key, send):
+        with self._lock:
+            future = self._entries.get(key)
+            owner = future is None
+            if owner:
+                future = self._entries[key] = Future()
+                self.misses += 1
+            else:
+                self.hits += 1
+
+        if not owner:
+            return future.result()
+
+        try:
+            response = send()
+            response.content  # letto subito: il body viene riusato da più thread
+        except Exception as e:
+            self._forget(key, future)
+            future.set_exception(e)
+            raise
+
+        if not response.ok:
+            self._forget(key, future)
+        future.set_result(response)
+        return response
+
+
+class RateLimitedSession(requests.Session):
+    """
+    Session che prende un token dal limiter prima di ogni richiesta e, su
+    429/503, rallenta e ritenta (fino a MAX_THROTTLE_RETRIES volte, con
+    backoff esponenziale se manca Retry-After).
+    """
+
+    def __init__(self, limiter=None):
+        super().__init__()
+        self.limiter = limiter or TokenBucketLimiter()
+        self.read_cache = None
+
+    def request(self, method, url, *args, **kwargs):
+        cache = self.read_cache
+        if cache is None:
+            return self._request(method, url, *args, **kwargs)
+        if ReadCache.is_read(method, url) and not args and kwargs.get("data") is None:
+            key = ReadCache.key(method, url, kwargs)
+            return cache.fetch(key, lambda: self._request(method, url, **kwargs))
+
+        # Scrittura: prima e dopo, così nemmeno le letture in volo durante la
+        # richiesta restano in cache
+        cache.invalidate()
+        try:
+            return self._request(method, url, *args, **kwargs)
+        finally:
+            cache.invalidate()
+
+    def _request(self, method, url, *args, **kwargs):
+        for attempt in range(MAX_THROTTLE_RETRIES + 1):
+            self.limiter.acquire()
+            response = super().request(method, url, *args, **kwargs)
+            if response.status_code not in THROTTLE_STATUSES:
+                self.limiter.on_success()
+                return response
+            if attempt == MAX_THROTTLE_RETRIES:
+                return response
+            self.limiter.on_throttle(parse_retry_after(response.headers.get("Retry-After")),
+                                     backoff=0.5 * 2 ** attempt)
+            response.close()
+
+
+def create_session(pool_size=DEFAULT_POOL_SIZE):
+    """
+    Crea una Session con pool keep-alive di pool_size connessioni.
+    Con pool_block=True i thread in eccesso attendono una connessione libera
+    invece di aprirne di nuove fuori dal pool.
+    """
+    session = RateLimitedSession()
+    mount_pool(session, pool_size)
+    session.headers.update({
+        "Accept-Encoding": "gzip, deflate",
+        "Connection": "keep-alive"
+    })
+    return session
+
+
+def get_session(pool_size=None):
+    """
+    Restituisce la Session condivisa del processo, creandola alla prima chiamata.
+    pool_size ha effetto solo sulla prima chiamata.
+    """
+    global _session
+    if _session is None:
+        _session = create_session(pool_size or DEFAULT_POOL_SIZE)
+    return _session
+
+
+def enable_read_cache():
+    """Attiva sulla Session condivisa la cache delle letture GET/HEAD identiche"""
+    session = get_session()
+    if session.read_cache is None:
+        session.read_cache = ReadCache()
+    return session.read_cache
+
+
+def iter_keyset(url, headers, select, key="id", page_size=1000, params=None):
+    """
+    Legge un'intera tabella a pagine con paginazione keyset (order=key,
+    key=gt.<ultimo>) invece di limit/offset: ogni pagina usa l'indice sulla
+    chiave, quindi la scansione completa è lineare e mai troncata.
+    Genera liste di righe; select deve includere key. Solleva su errori HTTP.
+    Si ferma solo a una pagina vuota: PostgREST tronca le risposte a max_rows
+    anche se page_size è maggiore, quindi una pagina corta non è l'ultima.
+    """
+    session = get_session()
+    last_key = None
+
+    while True:
+        query = {**(params or {}), "select": select, "order": f"{key}.asc", "limit": page_size}
+        if last_key is not None:
+            query[key] = f"gt.{last_key}"
+
+        response = session.get(url, headers=headers, params=query)
+        response.raise_for_status()
+
+        rows = response.json()
+        if not rows:
+            return
+        yield rows
+        last_key = rows[-1][key]
+
+
+def grouped_counts(dimension, limit=None):
+    """
+    Conteggi per valore calcolati lato server dalla RPC grouped_counts
+    (es. 'opere.tipo', 'partecipazioni.ruolo'): lista di (valore, righe), dal
+    più frequente. Trasferisce una riga per gruppo invece delle righe da contare.
+    """
+    response = get_session().post(
+        f"{rest_url()}/rpc/grouped_counts",
+        headers=service_headers(),
+        json={"p_dimension": dimension, "p_limit": limit}
+    )
+    response.raise_for_status()
+    return [(row["value"], row["row_count"]) for row in response.json()]
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Rate limiting adattivo per le chiamate REST verso Supabase.
+
+TokenBucketLimiter è un token bucket condiviso da tutti i thread del processo
+con regolazione AIMD: ogni risposta accettata alza il ritmo di un passo fisso
+(additive increase), ogni 429/503 lo dimezza (multiplicative decrease) e
+sospende le richieste per il tempo indicato da Retry-After. Così la capacità
+libera viene usata tutta e si rallenta solo quando Supabase lo chiede.
+Ritmo iniziale e massimo si configurano con SUPABASE_RATE_LIMIT e
+SUPABASE_RATE_LIMIT_MAX (richieste al secondo).
+"""
+
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+DEFAULT_RATE = float(os.environ.get("SUPABASE_RATE_LIMIT", "50"))
+DEFAULT_MAX_RATE = float(os.environ.get("SUPABASE_RATE_LIMIT_MAX", "500"))
+
+THROTTLE_STATUSES = (429, 503)
+
+
+def parse_retry_after(value):
+    """Secondi indicati da un header Retry-After (secondi o data HTTP), o None"""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucketLimiter:
+    def __init__(self, rate=DEFAULT_RATE, min_rate=1.0, max_rate=DEFAULT_MAX_RATE,
+                 increase=0.5, decrease=0.5):
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max(max_rate, rate)
+        self.increase = increase
+        self.decrease = decrease
+        self.throttled = 0
+        self._tokens = 1.0
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._last_decrease = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        # Raffica massima: un secondo di richieste al ritmo corrente
+        self._tokens = min(max(self.rate, 1.0), self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self):
+        """Attende un token (e la fine di un eventuale Retry-After)"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now >= self._blocked_until and self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = max(self._blocked_until - now, (1 - self._tokens) / self.rate)
+            time.sleep(wait)
+
+    def on_success(self):
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def on_throttle(self, retry_after=None, backoff=1.0):
+        """
+        Risposta 429/503: dimezza il ritmo e blocca le richieste per retry_after
+        secondi (o backoff se il server non lo indica). Più rifiuti arrivati
+        insieme dai thread in volo contano come un solo decremento.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self.throttled += 1
+            if now - self._last_decrease >= 1.0 / self.rate:
+                self.rate = max(self.min_rate, self.rate * self.decrease)
+                self._last_decrease = now
+            self._tokens = 0.0
+            delay = retry_after if retry_after is not None else backoff
+            self._blocked_until = max(self._blocked_until, now + delay)
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+"""
+Riconciliazione MySQL / PostgreSQL per hash di intervalli di chiave (Merkle).
+
+Ogni entità è ridotta a righe (chiave, hash): MySQL le calcola con la query di
+EntitySpec, PostgreSQL con la RPC reconcile_rows (migrazioni
+20261018130000_reconcile_range_hashes.sql e 20261018200000_reconcile_range_pushdown.sql),
+sullo stesso testo canonico.
+reconcile() confronta (numero di righe, somma degli hash) per intervallo su
+entrambi i lati, scarta gli intervalli uguali e divide in fanout parti solo
+quelli diversi, finché non sono abbastanza piccoli da confrontarne le righe.
+Se i database coincidono quasi ovunque si scambiano pochi aggregati invece
+dell'intera tabella.
+"""
+
+from collections import defaultdict
+from dataclasses import dataclass, field
+
+import mysql.connector
+
+from common.parallel_extract import split_range
+from common.postgrest import get_session, rest_url, service_headers
+
+# Gli intervalli di un livello vengono interrogati a blocchi di questa dimensione:
+# reconcile_range_hashes restituisce una riga per intervallo, entro max-rows
+MAX_RANGES_PER_QUERY = 1000
+# Righe foglia per richiesta (e per pagina di reconcile_range_rows): non oltre
+# il max-rows di PostgREST (supabase/config.toml)
+MAX_LEAF_ROWS_PER_QUERY = 1000
+
+
+@dataclass
+class EntitySpec:
+    """
+    Entità riconciliabile. key è la chiave MySQL (intera) salvata anche sulla
+    riga PostgreSQL; columns sono espressioni MySQL il cui testo deve
+    coincidere con quello costruito da reconcile_rows(name) in PostgreSQL.
+    """
+    name: str
+    table: str
+    key: str
+    columns: list
+    where: str = ""
+
+    def row_text_sql(self):
+        # Stesso formato di concat_ws('|', chiave, coalesce(col, '\N'), ...) in PostgreSQL
+        parts = [f"CAST({self.key} AS CHAR)"] + [f"COALESCE({column}, '\\\\N')" for column in self.columns]
+        return f"CONCAT_WS('|', {', '.join(parts)})"
+
+    def row_hash_sql(self):
+        # Primi 60 bit dell'md5: la somma per intervallo resta esatta (DECIMAL in MySQL, numeric in PostgreSQL)
+        return f"CAST(CONV(LEFT(MD5({self.row_text_sql()}), 15), 16, 10) AS UNSIGNED)"
+
+    def filter_sql(self, extra):
+        conditions = [c for c in (self.where, extra) if c]
+        return f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+
+@dataclass
+class ReconcileResult:
+    """Chiavi da inserire, aggiornare o eliminare in PostgreSQL, con statistiche"""
+    missing: list = field(default_factory=list)
+    changed: list = field(default_factory=list)
+    extra: list = field(default_factory=list)
+    hash_queries: int = 0
+    compared_ranges: int = 0
+    leaf_rows: int = 0
+
+    def __bool__(self):
+        return bool(self.missing or self.changed or self.extra)
+
+
+def _bucket_bounds(ranges):
+    """
+    Estremi ordinati degli intervalli e, per ogni intervallo, il numero del suo
+    bucket secondo INTERVAL()/width_bucket (1-based sugli estremi).
+    """
+    bounds = sorted({edge for lo, hi in ranges for edge in (lo, hi)})
+    index = {edge: i + 1 for i, edge in enumerate(bounds)}
+    return bounds, {(lo, hi): index[lo] for lo, hi in ranges}
+
+
+class MysqlSide:
+    def __init__(self, mysql_config, spec):
+        self.spec = spec
+        self.conn = mysql.connector.connect(**mysql_config)
+
+    def close(self):
+        self.conn.close()
+
+    def key_bounds(self):
+        cursor = self.conn.cursor()
+        cursor.execute(f"SELECT MIN({self.spec.key}), MAX({self.spec.key}) FROM {self.spec.table} "
+                       f"{self.spec.filter_sql('')}")
+        row = cursor.fetchone()
+        cursor.close()
+        return row
+
+    def range_hashes(self, ranges):
+        """{intervallo: (righe, somma hash, chiave min, chiave max)} degli intervalli non vuoti"""
+        bounds, buckets = _bucket_bounds(ranges)
+        key = self.spec.key
+        placeholders = ", ".join(["%s"] * len(bounds))
+        query = (
+            f"SELECT INTERVAL({key}, {placeholders}) AS bucket, COUNT(*), SUM({self.spec.row_hash_sql()}), "
+            f"MIN({key}), MAX({key}) FROM {self.spec.table} "
+            f"{self.spec.filter_sql(f'{key} >= %s AND {key} < %s')} GROUP BY bucket"
+        )
+        cursor = self.conn.cursor()
+        cursor.execute(query, (*bounds, bounds[0], bounds[-1]))
+        hashes = {bucket: (count, int(total), lo, hi) for bucket, count, total, lo, hi in cursor}
+        cursor.close()
+        # I bucket tra intervalli non adiacenti non appartengono a nessun intervallo
+        return {rng: hashes[bucket] for rng, bucket in buckets.items() if bucket in hashes}
+
+    def range_rows(self, ranges):
+        """{chiave: [hash ordinati]} delle righe negli intervalli"""
+        key = self.spec.key
+        ranges_sql = " OR ".join([f"({key} >= %s AND {key} < %s)"] * len(ranges))
+        query = (
+            f"SELECT {key}, {self.spec.row_hash_sql()} FROM {self.spec.table} "
+            f"{self.spec.filter_sql(f'({ranges_sql})')}"
+        )
+        cursor = self.conn.cursor()
+        cursor.execute(query, [edge for r in ranges for edge in r])
+        rows = defaultdict(list)
+        for row_key, row_hash in cursor:
+            rows[row_key].append(int(row_hash))
+        cursor.close()
+        return {row_key: sorted(hashes) for row_key, hashes in rows.items()}
+
+
+class PostgresSide:
+    def __init__(self, spec):
+        self.spec = spec
+        self.session = get_session()
+        self.headers = service_headers()
+
+    def _rpc(self, name, query=None, **params):
+        response = self.session.post(f"{rest_url()}/rpc/{name}", headers=self.headers, params=query,
+                                     json={"p_entity": self.spec.name, **params})
+        response.raise_for_status()
+        return response.json()
+
+    def key_bounds(self):
+        # Un solo bucket che copre l'intero bigint: restituisce anche min e max
+        rows = self._rpc("reconcile_range_hashes", p_ranges=[-2 ** 63, 2 ** 63 - 1])
+        return (rows[0]["min_key"], rows[0]["max_key"]) if rows else (None, None)
+
+    def range_hashes(self, ranges):
+        # Una riga per intervallo non vuoto, bucket = posizione (1-based) in ranges
+        rows = self._rpc("reconcile_range_hashes", p_ranges=[edge for rng in ranges for edge in rng])
+        return {ranges[r["bucket"] - 1]: (r["row_count"], int(r["hash_sum"]), r["min_key"], r["max_key"])
+                for r in rows}
+
+    def range_rows(self, ranges):
+        # A pagine limit/offset: un intervallo di una sola chiave (es. un codOpera con
+        # molte partecipazioni) può superare max-rows e verrebbe troncato in silenzio.
+        # Il limite non supera max-rows, quindi una pagina corta è l'ultima.
+        rows = defaultdict(list)
+        p_ranges = [edge for rng in ranges for edge in rng]
+        offset = 0
+        while True:
+            page = self._rpc("reconcile_range_rows", query={"limit": MAX_LEAF_ROWS_PER_QUERY, "offset": offset},
+                             p_ranges=p_ranges)
+            for r in page:
+                rows[r["key"]].append(r["row_hash"])
+            if len(page) < MAX_LEAF_ROWS_PER_QUERY:
+                break
+            offset += len(page)
+        return {row_key: sorted(hashes) for row_key, hashes in rows.items()}
+
+
+def _compare_level(ranges, mysql_side, pg_side, result):
+    """(intervalli diversi ristretti alle chiavi presenti, conteggio massimo) per un livello"""
+    differing = []
+    for i in range(0, len(ranges), MAX_RANGES_PER_QUERY):
+        chunk = ranges[i:i + MAX_RANGES_PER_QUERY]
+        mysql_hashes = mysql_side.range_hashes(chunk)
+        pg_hashes = pg_side.range_hashes(chunk)
+        result.hash_queries += 2
+        result.compared_ranges += len(chunk)
+
+        for rng in chunk:
+            empty = (0, 0, None, None)
+            mine = mysql_hashes.get(rng, empty)
+            theirs = pg_hashes.get(rng, empty)
+            if mine[:2] == theirs[:2]:
+                continue
+            lo = min(k for k in (mine[2], theirs[2]) if k is not None)
+            hi = max(k for k in (mine[3], theirs[3]) if k is not None) + 1
+            differing.append(((lo, hi), max(mine[0], theirs[0])))
+    return differing
+
+
+def _leaf_chunks(leaves, max_rows):
+    """Raggruppa gli intervalli foglia in richieste da al massimo max_rows righe stimate"""
+    chunk, rows = [], 0
+    for rng, count in leaves:
+        if chunk and rows + count > max_rows:
+            yield chunk
+            chunk, rows = [], 0
+        chunk.append(rng)
+        rows += count
+    if chunk:
+        yield chunk
+
+
+def reconcile(mysql_config, spec, fanout=16, leaf_size=256, log=print):
+    """
+    Confronta spec tra MySQL e PostgreSQL. Restituisce un ReconcileResult con
+    le chiavi mancanti in PostgreSQL, quelle con righe diverse e quelle
+    presenti solo in PostgreSQL.
+    """
+    # Un intervallo foglia deve stare in una sola risposta di reconcile_range_rows
+    leaf_size = min(leaf_size, MAX_LEAF_ROWS_PER_QUERY)
+    mysql_side = MysqlSide(mysql_config, spec)
+    pg_side = PostgresSide(spec)
+    result = ReconcileResult()
+
+    try:
+        edges = [k for k in (*mysql_side.key_bounds(), *pg_side.key_bounds()) if k is not None]
+        if not edges:
+            return result
+
+        pending = [(min(edges), max(edges) + 1)]
+        leaves = []
+        level = 0
+        while pending:
+            differing = _compare_level(pending, mysql_side, pg_side, result)
+            log(f"   livello {level}: {len(pending)} intervalli, {len(differing)} diversi")
+            pending = []
+            for (lo, hi), count in differing:
+                if count <= leaf_size or hi - lo <= 1:
+                    leaves.append(((lo, hi), count))
+                else:
+                    pending.extend(split_range(lo, hi - 1, fanout))
+            level += 1
+
+        for chunk in _leaf_chunks(leaves, MAX_LEAF_ROWS_PER_QUERY):
+            mysql_rows = mysql_side.range_rows(chunk)
+            pg_rows = pg_side.range_rows(chunk)
+            result.leaf_rows += sum(map(len, mysql_rows.values())) + sum(map(len, pg_rows.values()))
+
+            for row_key in sorted(mysql_rows.keys() | pg_rows.keys()):
+                if row_key not in pg_rows:
+                    result.missing.append(row_key)
+                elif row_key not in mysql_rows:
+                    result.extra.append(row_key)
+                elif mysql_rows[row_key] != pg_rows[row_key]:
+                    result.changed.append(row_key)
+    finally:
+        mysql_side.close()
+
+    return result
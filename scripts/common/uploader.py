@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Upload concorrente di batch verso una tabella PostgREST.
+
+BatchUploader mantiene al massimo max_in_flight POST contemporanee sulla
+session condivisa: submit() blocca finché una slot non si libera, quindi il
+produttore (lo stream MySQL) non accumula mai più di max_in_flight batch in
+memoria. Il conteggio di batch inseriti e falliti non dipende dall'ordine in
+cui le risposte arrivano. La dimensione dei batch è governata da un
+AdaptiveBatchSize (vedi common.batching): i batch rifiutati per dimensione
+vengono divisi e ritentati.
+
+Con un Checkpoint (vedi common.checkpoint) il checkpoint avanza solo sul
+prefisso contiguo di batch confermati: un batch fallito blocca l'avanzamento
+finché non viene reinviato da una ripresa con --resume. La ripresa reinvia
+anche i batch già confermati dopo quello fallito, quindi l'url deve essere
+idempotente (on_conflict + Prefer resolution=...) quando si usa un checkpoint.
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from common.batching import AdaptiveBatchSize, send_adaptive
+from common.postgrest import get_session, ensure_pool_size
+
+DEFAULT_MAX_IN_FLIGHT = 4
+
+
+class BatchUploader:
+    def __init__(self, url, headers, max_in_flight=DEFAULT_MAX_IN_FLIGHT, on_result=None, sizer=None, checkpoint=None):
+        """
+        url: endpoint della tabella (es. .../rest/v1/opere)
+        on_result: callback opzionale (batch_number, batch, error) invocata al
+        termine di ogni batch; error è None se tutte le righe sono state accettate
+        sizer: AdaptiveBatchSize da cui il produttore legge la dimensione dei batch
+        checkpoint: Checkpoint aggiornato con la chiave passata a submit()
+        """
+        self.url = url
+        self.headers = headers
+        self.max_in_flight = max_in_flight
+        self.on_result = on_result
+        self.sizer = sizer or AdaptiveBatchSize()
+        self.checkpoint = checkpoint
+
+        self.session = get_session()
+        ensure_pool_size(self.session, max_in_flight)
+
+        self.inserted_rows = 0
+        self.inserted_batches = 0
+        self.failed_rows = 0
+        self.failed_batches = []
+
+        self._submitted = 0
+        self._pending = {}
+        self._next_to_ack = 1
+        _, previous = checkpoint.resume_key() if checkpoint else (None, {})
+        self._acked_rows = previous.get("inserted", 0)
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._executor = ThreadPoolExecutor(max_workers=max_in_flight)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def submit(self, batch, key=None):
+        """
+        Accoda un batch, bloccando se ci sono già max_in_flight richieste in volo.
+        key è la chiave sorgente più alta coperta dal batch, usata per il checkpoint.
+        """
+        if not batch:
+            return
+        self._slots.acquire()
+        self._submitted += 1
+        with self._lock:
+            self._pending[self._submitted] = {"key": key, "rows": len(batch), "ok": None}
+        self._executor.submit(self._send, self._submitted, batch)
+
+    def close(self):
+        """Attende il completamento di tutti i batch in volo"""
+        self._executor.shutdown(wait=True)
+
+    def _send(self, batch_number, batch):
+        try:
+            results = send_adaptive(
+                batch,
+                self.sizer,
+                lambda chunk: self.session.post(self.url, headers=self.headers, json=chunk)
+            )
+            ok_rows = sum(len(chunk) for chunk, _, error in results if error is None)
+            errors = [error for _, _, error in results if error is not None]
+            error = errors[0] if errors else None
+
+            with self._lock:
+                self.inserted_rows += ok_rows
+                if error is None:
+                    self.inserted_batches += 1
+                    print(f"   ✅ Batch {batch_number}: {len(batch)} record (totale: {self.inserted_rows}, prossimo batch: {self.sizer.size})")
+                else:
+                    self.failed_rows += len(batch) - ok_rows
+                    self.failed_batches.append(batch_number)
+                    print(f"   ❌ Batch {batch_number}: {len(batch) - ok_rows}/{len(batch)} record rifiutati - {error}")
+
+                self._pending[batch_number]["ok"] = error is None
+                self._advance_checkpoint()
+
+                if self.on_result:
+                    self.on_result(batch_number, batch, error)
+        finally:
+            self._slots.release()
+
+    def _advance_checkpoint(self):
+        """Avanza il checkpoint sui batch confermati contigui (chiamato sotto lock)"""
+        last_key = None
+        while self._pending.get(self._next_to_ack, {}).get("ok"):
+            entry = self._pending.pop(self._next_to_ack)
+            self._acked_rows += entry["rows"]
+            last_key = entry["key"]
+            self._next_to_ack += 1
+
+        if self.checkpoint and last_key is not None:
+            self.checkpoint.save(last_key, inserted=self._acked_rows)
+
+    def print_summary(self):
+        print(f"Batch inseriti: {self.inserted_batches} ({self.inserted_rows} record)")
+        if self.failed_batches:
+            print(f"Batch falliti: {len(self.failed_batches)} ({self.failed_rows} record) - {sorted(self.failed_batches)}")
@@ -1,6 +1,9 @@
 #!/usr/bin/env python3
 import os
-import requests
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.postgrest import get_session
 
 # Supabase PostgreSQL connection details
 supabase_url = os.environ["SUPABASE_URL"].rstrip("/") + "/rest/v1"
@@ -12,6 +15,8 @@ headers = {
     "Content-Type": "application/json"
 }
 
+session = get_session()
+
 def create_ruoli():
     """Creare i ruoli di base in Supabase"""
     try:
@@ -53,7 +58,7 @@ def create_ruoli():
         
         ruoli_creati = []
         for ruolo in ruoli_da_creare:
-            response = requests.post(
+            response = session.post(
                 f"{supabase_url}/ruoli",
                 headers=headers,
                 json=ruolo
@@ -79,7 +84,7 @@ def create_ruoli():
 def verify_ruoli():
     """Verificare i ruoli creati"""
     try:
-        response = requests.get(
+        response = session.get(
             f"{supabase_url}/ruoli",
             headers=headers,
             params={"select": "*", "limit": 20}
@@ -1,6 +1,9 @@
 #!/usr/bin/env python3
 import os
-import requests
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.postgrest import get_session
 
 # Supabase PostgreSQL connection details
 supabase_url = os.environ["SUPABASE_URL"].rstrip("/") + "/rest/v1"
@@ -12,6 +15,8 @@ headers = {
     "Content-Type": "application/json"
 }
 
+session = get_session()
+
 def insert_default_ruolo():
     """Inserire direttamente un ruolo usando un INSERT SQL raw"""
     try:
@@ -30,7 +35,7 @@ def insert_default_ruolo():
             'stato_validazione': 'validato'
         }
         
-        response = requests.post(
+        response = session.post(
             f"{supabase_url}/partecipazioni",
             headers=headers,
             json=test_record
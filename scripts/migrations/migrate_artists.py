@@ -1,10 +1,24 @@
 #!/usr/bin/env python3
 import os
 import mysql.connector
-import requests
+import sys
+import argparse
 import json
 from datetime import datetime
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.postgrest import get_session, iter_keyset
+from common.mysql_stream import iter_batches
+from common.parallel_extract import iter_sharded
+from common.batching import AdaptiveBatchSize, sized_batches
+from common.checkpoint import Checkpoint
+from common.pg_copy import copy_records, default_db_url
+from common.fingerprints import FingerprintStore
+from common.uploader import BatchUploader, DEFAULT_MAX_IN_FLIGHT
+
+# Columns written by the COPY backend (keys of the mapped records)
+ARTIST_COLUMNS = ['codice_artista', 'nome', 'cognome', 'codice_fiscale', 'data_nascita', 'imdb_nconst']
+
 # MySQL connection details
 mysql_config = {
     'host': '86.105.14.112',
@@ -21,9 +35,14 @@ headers = {
     "apikey": supabase_key,
     "Authorization": f"Bearer {supabase_key}",
     "Content-Type": "application/json",
-    "Prefer": "return=representation"
+    "Prefer": "return=minimal"
 }
 
+session = get_session()
+
+# Last acknowledged cod_artista, used by --resume
+checkpoint = Checkpoint("migrate_artists", "cod_artista")
+
 def explore_mysql_table():
     """Connect to MySQL and explore the artisti table structure"""
     try:
@@ -66,7 +85,7 @@ def check_postgresql_table():
     """Check if artisti table exists in PostgreSQL"""
     try:
         # Check if table exists
-        response = requests.get(
+        response = session.get(
             f"{supabase_url}/artisti",
             headers=headers,
             params={"limit": 1}
@@ -94,7 +113,7 @@ def create_postgresql_table():
     """Create artist table in PostgreSQL using Supabase SQL API"""
     try:
         # First, let's check what tables exist
-        response = requests.get(
+        response = session.get(
             f"{supabase_url}/",
             headers=headers
         )
@@ -117,95 +136,164 @@ def create_postgresql_table():
         print(f"Error: {e}")
         return False
 
-def migrate_data():
+def map_artist(artist):
+    """Map a MySQL artisti row to a PostgreSQL artisti record"""
+    # Split nome into nome and cognome
+    full_name = artist['nome'] or ''
+    
+    # Try to intelligently split the name
+    if '/' in full_name:
+        # Handle cases like "AGRÒ DANIELA/CONTI SILVIA"
+        nome = full_name
+        cognome = 'ARTISTA'  # Default surname for complex names
+    else:
+        # Split by space and assume last word is surname
+        name_parts = full_name.strip().split()
+        if len(name_parts) >= 2:
+            cognome = name_parts[-1]
+            nome = ' '.join(name_parts[:-1])
+        elif len(name_parts) == 1:
+            cognome = name_parts[0]
+            nome = ''
+        else:
+            cognome = 'SCONOSCIUTO'
+            nome = ''
+    
+    # Map MySQL fields to PostgreSQL fields
+    return {
+        'codice_artista': artist['cod_artista'],
+        'nome': nome if nome else full_name,
+        'cognome': cognome,
+        'codice_fiscale': artist['cf'],
+        'data_nascita': artist['nascita'].strftime('%Y-%m-%d') if artist['nascita'] else None,
+        'imdb_nconst': artist['nconst']
+    }
+
+def copy_data(records, db_url, upsert=False, checkpoint=None, fingerprints=None):
+    """Load mapped records with PostgreSQL COPY + a single merge statement"""
+    print("\nStreaming data from MySQL into PostgreSQL COPY...")
+    _, previous = checkpoint.resume_key() if checkpoint else (None, {})
+    copied, written, last_key = copy_records(
+        db_url,
+        "artisti",
+        ARTIST_COLUMNS,
+        ((record['codice_artista'], record) for record in records),
+        conflict_key="codice_artista" if upsert else None
+    )
+    
+    if checkpoint and last_key is not None:
+        checkpoint.save(last_key, inserted=previous.get('inserted', 0) + written)
+    if fingerprints:
+        fingerprints.commit()
+    
+    print(f"\nFetched {copied} records")
+    print(f"Total records inserted: {written}")
+    
+    return written
+
+def upload_data(records, concurrency, upsert=False, checkpoint=None, fingerprints=None):
+    """Upload mapped records through PostgREST, `concurrency` batches in flight"""
+    url, upload_headers = f"{supabase_url}/artisti", headers
+    if upsert:
+        # Idempotent load: rows whose codice_artista already exists are merged, not duplicated
+        url += "?on_conflict=codice_artista"
+        upload_headers = {**headers, "Prefer": "resolution=merge-duplicates,return=minimal"}
+    
+    # Batch size starts at 50 and adapts to payload size and server latency
+    print(f"\nStreaming data from MySQL ({concurrency} batches in flight)...")
+    total_fetched = 0
+    
+    def on_result(batch_number, batch, error):
+        # Only acknowledged rows get a fingerprint; failed ones are resent next sync
+        if fingerprints and error is None:
+            fingerprints.commit(batch)
+    
+    sizer = AdaptiveBatchSize(initial=50)
+    with BatchUploader(url, upload_headers, max_in_flight=concurrency, sizer=sizer,
+                       checkpoint=checkpoint, on_result=on_result) as uploader:
+        for batch in sized_batches(records, sizer):
+            total_fetched += len(batch)
+            uploader.submit(batch, key=batch[-1]['codice_artista'])
+    
+    print(f"\nFetched {total_fetched} records")
+    uploader.print_summary()
+    print(f"Total records inserted: {uploader.inserted_rows}")
+    
+    return uploader.inserted_rows
+
+def migrate_data_sharded(concurrency, upsert, backend, db_url, workers, fingerprints=None):
+    """Extract and map artisti in `workers` processes, one cod_artista range each"""
+    # Shards finish out of cod_artista order, so there is no single high-water mark to checkpoint
+    checkpoint.clear()
+    records = (
+        record
+        for batch in iter_sharded(mysql_config, "artisti", "cod_artista", map_artist, workers)
+        for _, record in batch
+    )
+    if fingerprints:
+        records = fingerprints.changed(records)
+    
+    if backend == "copy":
+        return copy_data(records, db_url, upsert, fingerprints=fingerprints)
+    
+    return upload_data(records, concurrency, upsert, fingerprints=fingerprints)
+
+def migrate_data(concurrency=DEFAULT_MAX_IN_FLIGHT, resume=False, upsert=False, backend="rest", db_url=None, workers=1, delta=False):
     """Migrate data from MySQL to PostgreSQL"""
+    fingerprints = None
     try:
-        # Connect to MySQL
-        conn = mysql.connector.connect(**mysql_config)
-        cursor = conn.cursor(dictionary=True)
-        
-        # Fetch all data from MySQL
-        print("\nFetching all data from MySQL...")
-        cursor.execute("SELECT * FROM artisti")
-        artists = cursor.fetchall()
-        
-        print(f"Fetched {len(artists)} records")
-        
-        # Prepare data for batch insert - map MySQL columns to PostgreSQL columns
-        batch_data = []
-        for artist in artists:
-            # Split nome into nome and cognome
-            full_name = artist['nome'] or ''
-            
-            # Try to intelligently split the name
-            if '/' in full_name:
-                # Handle cases like "AGRÒ DANIELA/CONTI SILVIA"
-                nome = full_name
-                cognome = 'ARTISTA'  # Default surname for complex names
-            else:
-                # Split by space and assume last word is surname
-                name_parts = full_name.strip().split()
-                if len(name_parts) >= 2:
-                    cognome = name_parts[-1]
-                    nome = ' '.join(name_parts[:-1])
-                elif len(name_parts) == 1:
-                    cognome = name_parts[0]
-                    nome = ''
-                else:
-                    cognome = 'SCONOSCIUTO'
-                    nome = ''
-            
-            # Map MySQL fields to PostgreSQL fields
-            mapped_record = {
-                'codice_artista': artist['cod_artista'],
-                'nome': nome if nome else full_name,
-                'cognome': cognome,
-                'codice_fiscale': artist['cf'],
-                'data_nascita': artist['nascita'].strftime('%Y-%m-%d') if artist['nascita'] else None,
-                'imdb_nconst': artist['nconst']
-            }
-            
-            batch_data.append(mapped_record)
-        
-        # Insert data in batches
-        batch_size = 50
-        total_inserted = 0
+        if resume:
+            # Resuming resends the batches acknowledged after the first failed one
+            upsert = True
+        if delta:
+            # Send only new or changed records; changed ones must update, so delta implies upsert
+            fingerprints = FingerprintStore("migrate_artists", "codice_artista")
+            upsert = True
+            # Rows deleted in PostgreSQL since the last sync must be resent, not skipped as unchanged
+            dropped = fingerprints.retain(
+                row["codice_artista"]
+                for rows in iter_keyset(f"{supabase_url}/artisti", headers, select="id,codice_artista")
+                for row in rows
+            )
+            if dropped:
+                print(f"Delta: {dropped} artisti no longer in PostgreSQL, they will be resent")
         
-        for i in range(0, len(batch_data), batch_size):
-            batch = batch_data[i:i + batch_size]
-            
-            try:
-                response = requests.post(
-                    f"{supabase_url}/artisti",
-                    headers=headers,
-                    json=batch
-                )
-                
-                if response.status_code in [200, 201]:
-                    total_inserted += len(batch)
-                    print(f"Inserted batch {i//batch_size + 1}: {len(batch)} records")
-                else:
-                    print(f"Error inserting batch: {response.status_code} - {response.text}")
-                    
-            except Exception as e:
-                print(f"Error inserting batch: {e}")
+        if workers > 1:
+            return migrate_data_sharded(concurrency, upsert, backend, db_url, workers, fingerprints)
         
-        print(f"\nTotal records inserted: {total_inserted}")
+        # Stream rows from MySQL in cod_artista order, so the checkpoint can resume them
+        query, params = "SELECT * FROM artisti", None
+        if resume:
+            last_key, state = checkpoint.resume_key()
+            if last_key is not None:
+                print(f"\nResuming after cod_artista {last_key} ({state.get('inserted', 0)} records already inserted)")
+                query, params = query + " WHERE cod_artista > %s", (last_key,)
+        else:
+            checkpoint.clear()
+        query += " ORDER BY cod_artista"
+        records = (map_artist(artist) for rows in iter_batches(mysql_config, query, params) for artist in rows)
+        if fingerprints:
+            records = fingerprints.changed(records)
         
-        cursor.close()
-        conn.close()
+        if backend == "copy":
+            return copy_data(records, db_url, upsert, checkpoint, fingerprints)
         
-        return total_inserted
+        return upload_data(records, concurrency, upsert, checkpoint, fingerprints)
         
     except Exception as e:
         print(f"Migration Error: {e}")
         return 0
+    
+    finally:
+        if fingerprints:
+            fingerprints.print_summary()
+            fingerprints.close()
 
 def verify_migration():
     """Verify the migration was successful"""
     try:
         # Get count using a different approach
-        response = requests.head(
+        response = session.head(
             f"{supabase_url}/artisti",
             headers={**headers, "Prefer": "count=exact"}
         )
@@ -217,7 +305,7 @@ def verify_migration():
                 print(f"\nPostgreSQL artisti table contains {count} records")
             else:
                 # Alternative: fetch with limit to get count
-                response = requests.get(
+                response = session.get(
                     f"{supabase_url}/artisti",
                     headers=headers,
                     params={"select": "codice_artista", "limit": 1000}
@@ -228,7 +316,7 @@ def verify_migration():
                     print(f"\nPostgreSQL artisti table contains at least {count} records")
             
             # Get sample data
-            response = requests.get(
+            response = session.get(
                 f"{supabase_url}/artisti",
                 headers=headers,
                 params={"limit": 5, "order": "codice_artista"}
@@ -250,6 +338,25 @@ def verify_migration():
         return 0
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Migrate artisti from MySQL to PostgreSQL")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_MAX_IN_FLIGHT,
+                        help="number of batches uploaded in parallel")
+    parser.add_argument("--resume", action="store_true",
+                        help="continue after the last checkpointed cod_artista (implies --upsert)")
+    parser.add_argument("--backend", choices=["rest", "copy"], default="rest",
+                        help="load through PostgREST batches or direct PostgreSQL COPY")
+    parser.add_argument("--db-url", default=default_db_url(),
+                        help="PostgreSQL connection string for --backend copy (default: $SUPABASE_DB_URL)")
+    parser.add_argument("--upsert", action="store_true",
+                        help="upsert on codice_artista so reruns update existing rows instead of duplicating them")
+    parser.add_argument("--delta", action="store_true",
+                        help="send only records new or changed since the last sync (implies --upsert)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="extract and map cod_artista ranges in N parallel processes")
+    args = parser.parse_args()
+    if args.workers > 1 and args.resume:
+        parser.error("--resume is not supported with --workers > 1 (use --upsert to rerun safely)")
+    
     print("Starting artist data migration from MySQL to PostgreSQL...\n")
     
     # Step 1: Explore MySQL table
@@ -270,7 +377,7 @@ if __name__ == "__main__":
         if table_exists:
             # Step 3: Migrate data
             print("\nStarting data migration...")
-            migrated_count = migrate_data()
+            migrated_count = migrate_data(args.concurrency, args.resume, args.upsert, args.backend, args.db_url, args.workers, args.delta)
             
             # Step 4: Verify migration
             if migrated_count > 0:
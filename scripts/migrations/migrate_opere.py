@@ -1,10 +1,26 @@
 #!/usr/bin/env python3
 import os
 import mysql.connector
-import requests
-import json
+import sys
+import argparse
 from datetime import datetime
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.postgrest import get_session, iter_keyset
+from common.mysql_stream import iter_batches
+from common.parallel_extract import iter_sharded
+from common.batching import AdaptiveBatchSize, sized_batches
+from common.checkpoint import Checkpoint
+from common.pg_copy import copy_records, default_db_url
+from common.fingerprints import FingerprintStore
+from common.uploader import BatchUploader, DEFAULT_MAX_IN_FLIGHT
+
+# Columns written by the COPY backend (keys of the mapped records)
+OPERA_COLUMNS = [
+    'codice_opera', 'titolo', 'titolo_originale', 'anno_produzione', 'regista',
+    'codice_isan', 'casa_produzione', 'dettagli_serie', 'tipo'
+]
+
 # MySQL connection details
 mysql_config = {
     'host': '86.105.14.112',
@@ -21,9 +37,14 @@ headers = {
     "apikey": supabase_key,
     "Authorization": f"Bearer {supabase_key}",
     "Content-Type": "application/json",
-    "Prefer": "return=representation"
+    "Prefer": "return=minimal"
 }
 
+session = get_session()
+
+# Last acknowledged cod_opera, used by --resume
+checkpoint = Checkpoint("migrate_opere", "cod_opera")
+
 def explore_mysql_table():
     """Connect to MySQL and explore the opere table structure"""
     try:
@@ -66,7 +87,7 @@ def check_postgresql_table():
     """Check opere table structure in PostgreSQL"""
     try:
         # Check if table exists
-        response = requests.get(
+        response = session.get(
             f"{supabase_url}/opere",
             headers=headers,
             params={"limit": 1}
@@ -96,7 +117,7 @@ def remove_placeholder_data():
         print("\nChecking for existing data in PostgreSQL opere table...")
         
         # First get count of existing records
-        response = requests.get(
+        response = session.get(
             f"{supabase_url}/opere",
             headers=headers,
             params={"select": "id", "limit": 1000}
@@ -113,7 +134,7 @@ def remove_placeholder_data():
                 
                 # Delete by specific IDs
                 for record_id in ids_to_delete:
-                    response = requests.delete(
+                    response = session.delete(
                         f"{supabase_url}/opere",
                         headers=headers,
                         params={"id": f"eq.{record_id}"}
@@ -140,94 +161,167 @@ def remove_placeholder_data():
         print(f"Error: {e}")
         return False
 
-def migrate_data():
+def map_opera(opera):
+    """Map a MySQL opere row to a PostgreSQL opere record"""
+    # Map MySQL fields to PostgreSQL fields
+    mapped_record = {
+        'codice_opera': opera['cod_opera'],
+        'titolo': opera['titolo'],
+        'titolo_originale': opera['titolo_orig'],
+        'anno_produzione': int(opera['anno']) if opera['anno'] else None,
+        'regista': [opera['regia']] if opera['regia'] else [],  # Convert to array
+        'codice_isan': opera['cod_isan'],
+        'casa_produzione': opera['produttore']
+    }
+    
+    # Handle series information
+    if opera['stagione'] or opera['nStagione'] or opera['episodio'] or opera['nEpisodio'] or opera['titoloEpisodio']:
+        dettagli_serie = {}
+        if opera['stagione']:
+            dettagli_serie['stagione'] = opera['stagione']
+        if opera['nStagione'] and opera['nStagione'] != -1:
+            dettagli_serie['numero_stagione'] = opera['nStagione']
+        if opera['episodio']:
+            dettagli_serie['episodio'] = opera['episodio']
+        if opera['nEpisodio']:
+            dettagli_serie['numero_episodio'] = opera['nEpisodio']
+        if opera['titoloEpisodio']:
+            dettagli_serie['titolo_episodio'] = opera['titoloEpisodio']
+        
+        # A dict, not a JSON string: PostgREST stores it as a jsonb object (a string
+        # would become a jsonb string scalar) and pg_copy adapts it the same way
+        mapped_record['dettagli_serie'] = dettagli_serie
+        mapped_record['tipo'] = 'serie_tv'
+    else:
+        mapped_record['tipo'] = 'film'
+    
+    return mapped_record
+
+def copy_data(records, db_url, upsert=False, checkpoint=None, fingerprints=None):
+    """Load mapped records with PostgreSQL COPY + a single merge statement"""
+    print("\nStreaming data from MySQL into PostgreSQL COPY...")
+    _, previous = checkpoint.resume_key() if checkpoint else (None, {})
+    copied, written, last_key = copy_records(
+        db_url,
+        "opere",
+        OPERA_COLUMNS,
+        ((record['codice_opera'], record) for record in records),
+        conflict_key="codice_opera" if upsert else None
+    )
+    
+    if checkpoint and last_key is not None:
+        checkpoint.save(last_key, inserted=previous.get('inserted', 0) + written)
+    if fingerprints:
+        fingerprints.commit()
+    
+    print(f"\nFetched {copied} records")
+    print(f"Total records inserted: {written}")
+    
+    return written
+
+def upload_data(records, concurrency, upsert=False, checkpoint=None, fingerprints=None):
+    """Upload mapped records through PostgREST, `concurrency` batches in flight"""
+    url, upload_headers = f"{supabase_url}/opere", headers
+    if upsert:
+        # Idempotent load: rows whose codice_opera already exists are merged, not duplicated
+        url += "?on_conflict=codice_opera"
+        upload_headers = {**headers, "Prefer": "resolution=merge-duplicates,return=minimal"}
+    
+    # Batch size starts at 50 and adapts to payload size and server latency
+    print(f"\nStreaming data from MySQL ({concurrency} batches in flight)...")
+    total_fetched = 0
+    
+    def on_result(batch_number, batch, error):
+        # Only acknowledged rows get a fingerprint; failed ones are resent next sync
+        if fingerprints and error is None:
+            fingerprints.commit(batch)
+    
+    sizer = AdaptiveBatchSize(initial=50)
+    with BatchUploader(url, upload_headers, max_in_flight=concurrency, sizer=sizer,
+                       checkpoint=checkpoint, on_result=on_result) as uploader:
+        for batch in sized_batches(records, sizer):
+            total_fetched += len(batch)
+            uploader.submit(batch, key=batch[-1]['codice_opera'])
+    
+    print(f"\nFetched {total_fetched} records")
+    uploader.print_summary()
+    print(f"Total records inserted: {uploader.inserted_rows}")
+    
+    return uploader.inserted_rows
+
+def migrate_data_sharded(concurrency, upsert, backend, db_url, workers, fingerprints=None):
+    """Extract and map opere in `workers` processes, one cod_opera range each"""
+    # Shards finish out of cod_opera order, so there is no single high-water mark to checkpoint
+    checkpoint.clear()
+    records = (
+        record
+        for batch in iter_sharded(mysql_config, "opere", "cod_opera", map_opera, workers)
+        for _, record in batch
+    )
+    if fingerprints:
+        records = fingerprints.changed(records)
+    
+    if backend == "copy":
+        return copy_data(records, db_url, upsert, fingerprints=fingerprints)
+    
+    return upload_data(records, concurrency, upsert, fingerprints=fingerprints)
+
+def migrate_data(concurrency=DEFAULT_MAX_IN_FLIGHT, resume=False, upsert=False, backend="rest", db_url=None, workers=1, delta=False):
     """Migrate data from MySQL to PostgreSQL"""
+    fingerprints = None
     try:
-        # Connect to MySQL
-        conn = mysql.connector.connect(**mysql_config)
-        cursor = conn.cursor(dictionary=True)
-        
-        # Fetch all data from MySQL
-        print("\nFetching all data from MySQL...")
-        cursor.execute("SELECT * FROM opere")
-        opere = cursor.fetchall()
-        
-        print(f"Fetched {len(opere)} records")
-        
-        # Prepare data for batch insert - map MySQL columns to PostgreSQL columns
-        batch_data = []
-        for opera in opere:
-            # Map MySQL fields to PostgreSQL fields
-            mapped_record = {
-                'codice_opera': opera['cod_opera'],
-                'titolo': opera['titolo'],
-                'titolo_originale': opera['titolo_orig'],
-                'anno_produzione': int(opera['anno']) if opera['anno'] else None,
-                'regista': [opera['regia']] if opera['regia'] else [],  # Convert to array
-                'codice_isan': opera['cod_isan'],
-                'casa_produzione': opera['produttore']
-            }
-            
-            # Handle series information
-            if opera['stagione'] or opera['nStagione'] or opera['episodio'] or opera['nEpisodio'] or opera['titoloEpisodio']:
-                dettagli_serie = {}
-                if opera['stagione']:
-                    dettagli_serie['stagione'] = opera['stagione']
-                if opera['nStagione'] and opera['nStagione'] != -1:
-                    dettagli_serie['numero_stagione'] = opera['nStagione']
-                if opera['episodio']:
-                    dettagli_serie['episodio'] = opera['episodio']
-                if opera['nEpisodio']:
-                    dettagli_serie['numero_episodio'] = opera['nEpisodio']
-                if opera['titoloEpisodio']:
-                    dettagli_serie['titolo_episodio'] = opera['titoloEpisodio']
-                
-                mapped_record['dettagli_serie'] = json.dumps(dettagli_serie)
-                mapped_record['tipo'] = 'serie_tv'
-            else:
-                mapped_record['tipo'] = 'film'
-            
-            batch_data.append(mapped_record)
-        
-        # Insert data in batches
-        batch_size = 50
-        total_inserted = 0
+        if resume:
+            # Resuming resends the batches acknowledged after the first failed one
+            upsert = True
+        if delta:
+            # Send only new or changed records; changed ones must update, so delta implies upsert
+            fingerprints = FingerprintStore("migrate_opere", "codice_opera")
+            upsert = True
+            # Rows deleted in PostgreSQL since the last sync must be resent, not skipped as unchanged
+            dropped = fingerprints.retain(
+                row["codice_opera"]
+                for rows in iter_keyset(f"{supabase_url}/opere", headers, select="id,codice_opera")
+                for row in rows
+            )
+            if dropped:
+                print(f"Delta: {dropped} opere no longer in PostgreSQL, they will be resent")
         
-        for i in range(0, len(batch_data), batch_size):
-            batch = batch_data[i:i + batch_size]
-            
-            try:
-                response = requests.post(
-                    f"{supabase_url}/opere",
-                    headers=headers,
-                    json=batch
-                )
-                
-                if response.status_code in [200, 201]:
-                    total_inserted += len(batch)
-                    print(f"Inserted batch {i//batch_size + 1}: {len(batch)} records")
-                else:
-                    print(f"Error inserting batch: {response.status_code} - {response.text}")
-                    
-            except Exception as e:
-                print(f"Error inserting batch: {e}")
+        if workers > 1:
+            return migrate_data_sharded(concurrency, upsert, backend, db_url, workers, fingerprints)
         
-        print(f"\nTotal records inserted: {total_inserted}")
+        # Stream rows from MySQL in cod_opera order, so the checkpoint can resume them
+        query, params = "SELECT * FROM opere", None
+        if resume:
+            last_key, state = checkpoint.resume_key()
+            if last_key is not None:
+                print(f"\nResuming after cod_opera {last_key} ({state.get('inserted', 0)} records already inserted)")
+                query, params = query + " WHERE cod_opera > %s", (last_key,)
+        else:
+            checkpoint.clear()
+        query += " ORDER BY cod_opera"
+        records = (map_opera(opera) for rows in iter_batches(mysql_config, query, params) for opera in rows)
+        if fingerprints:
+            records = fingerprints.changed(records)
         
-        cursor.close()
-        conn.close()
+        if backend == "copy":
+            return copy_data(records, db_url, upsert, checkpoint, fingerprints)
         
-        return total_inserted
+        return upload_data(records, concurrency, upsert, checkpoint, fingerprints)
         
     except Exception as e:
         print(f"Migration Error: {e}")
         return 0
+    
+    finally:
+        if fingerprints:
+            fingerprints.print_summary()
+            fingerprints.close()
 
 def verify_migration():
     """Verify the migration was successful"""
     try:
         # Get count
-        response = requests.get(
+        response = session.get(
             f"{supabase_url}/opere",
             headers=headers,
             params={"select": "codice_opera", "limit": 1000}
@@ -239,7 +333,7 @@ def verify_migration():
             print(f"\nPostgreSQL opere table contains at least {count} records")
             
             # Get sample data
-            response = requests.get(
+            response = session.get(
                 f"{supabase_url}/opere",
                 headers=headers,
                 params={"limit": 5, "order": "codice_opera"}
@@ -261,6 +355,25 @@ def verify_migration():
         return 0
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Migrate opere from MySQL to PostgreSQL")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_MAX_IN_FLIGHT,
+                        help="number of batches uploaded in parallel")
+    parser.add_argument("--resume", action="store_true",
+                        help="continue after the last checkpointed cod_opera (implies --upsert)")
+    parser.add_argument("--backend", choices=["rest", "copy"], default="rest",
+                        help="load through PostgREST batches or direct PostgreSQL COPY")
+    parser.add_argument("--db-url", default=default_db_url(),
+                        help="PostgreSQL connection string for --backend copy (default: $SUPABASE_DB_URL)")
+    parser.add_argument("--upsert", action="store_true",
+                        help="upsert on codice_opera so reruns update existing rows instead of duplicating them")
+    parser.add_argument("--delta", action="store_true",
+                        help="send only records new or changed since the last sync (implies --upsert)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="extract and map cod_opera ranges in N parallel processes")
+    args = parser.parse_args()
+    if args.workers > 1 and args.resume:
+        parser.error("--resume is not supported with --workers > 1 (use --upsert to rerun safely)")
+    
     print("Starting opere data migration from MySQL to PostgreSQL...\n")
     
     # Step 1: Explore MySQL table
@@ -271,13 +384,16 @@ if __name__ == "__main__":
         table_exists = check_postgresql_table()
         
         if table_exists:
-            # Step 3: Try to remove placeholder data (skip if there are conflicts)
-            print("\nAttempting to remove placeholder data...")
-            remove_placeholder_data()
+            # Step 3: Try to remove placeholder data (skip if there are conflicts).
+            # Never on reruns: with --resume, --upsert or --delta the existing rows
+            # are real opere, and deleting them cascades to their partecipazioni
+            if not (args.resume or args.upsert or args.delta):
+                print("\nAttempting to remove placeholder data...")
+                remove_placeholder_data()
             
             # Step 4: Migrate data
             print("\nStarting data migration...")
-            migrated_count = migrate_data()
+            migrated_count = migrate_data(args.concurrency, args.resume, args.upsert, args.backend, args.db_url, args.workers, args.delta)
             
             # Step 5: Verify migration
             if migrated_count > 0:
@@ -1,9 +1,36 @@
 #!/usr/bin/env python3
 import os
-import mysql.connector
-import requests
+import sys
+import argparse
 import json
 from collections import defaultdict
+from functools import partial
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.postgrest import get_session, iter_keyset
+from common.mysql_stream import iter_batches
+from common.parallel_extract import iter_sharded
+from common.batching import AdaptiveBatchSize
+from common.checkpoint import Checkpoint
+from common.pg_copy import copy_records, default_db_url
+from common.uploader import BatchUploader, DEFAULT_MAX_IN_FLIGHT
+
+# Colonne scritte dal backend COPY (chiavi dei record costruiti da build_partecipazione)
+PARTECIPAZIONE_COLUMNS = ['artista_id', 'opera_id', 'ruolo_id', 'note']
+
+# Chiave naturale (indice unico NULLS NOT DISTINCT, migrazione 20261018180000):
+# le partecipazioni già presenti vengono saltate, così --resume non le duplica
+PARTECIPAZIONE_KEY = ['artista_id', 'opera_id', 'episodio_id', 'ruolo_id']
+
+# Ruolo Supabase (nome in minuscolo) -> ruolo MySQL: le righe di newRuoli con
+# altri ruoli non vengono migrate
+RUOLI_MYSQL = {
+    'protagonista primario': 'Primario',
+    'comprimario primario': 'Comprimario',
+    'doppiatore primario': 'Doppiatore Primario',
+    'doppiatore secondario': 'Doppiatore Comprimario',
+    'direzione doppiaggio': 'Direzione Doppiaggio',
+}
 
 # MySQL connection details
 mysql_config = {
@@ -23,10 +50,15 @@ headers = {
     "Content-Type": "application/json"
 }
 
+session = get_session()
+
+# Ultimo idRel confermato, usato da --resume
+checkpoint = Checkpoint("migrate_partecipazioni", "idRel")
+
 def check_ruoli_table():
     """Verificare se esiste una tabella ruoli_tipologie in Supabase"""
     try:
-        response = requests.get(
+        response = session.get(
             f"{supabase_url}/ruoli_tipologie",
             headers=headers,
             params={"limit": 20}
@@ -46,6 +78,26 @@ def check_ruoli_table():
         print(f"Errore controllo ruoli: {e}")
         return []
 
+def load_code_map(table, code_column):
+    """Caricare la mappatura codice MySQL -> id Supabase di un'intera tabella, a pagine keyset"""
+    code_map = {}
+    
+    for rows in iter_keyset(f"{supabase_url}/{table}", headers, select=f"id,{code_column}"):
+        for row in rows:
+            mysql_id = row.get(code_column)
+            supabase_id = row.get('id')
+            if mysql_id and supabase_id:
+                try:
+                    # Provare a convertire mysql_id in intero
+                    code_map[int(mysql_id)] = supabase_id
+                except ValueError:
+                    # Se non è un numero, mantenere come stringa
+                    code_map[mysql_id] = supabase_id
+        
+        print(f"Caricati {len(rows)} {table} (totale: {len(code_map)})")
+    
+    return code_map
+
 def create_id_mappings():
     """Creare le mappature tra MySQL e Supabase per artisti e opere"""
     try:
@@ -53,71 +105,12 @@ def create_id_mappings():
         
         # Mappatura artisti: MySQL cod_artista -> Supabase id
         print("Caricando mappatura artisti...")
-        response = requests.get(
-            f"{supabase_url}/artisti",
-            headers=headers,
-            params={"select": "id,codice_artista", "limit": 1000}
-        )
+        artisti_map = load_code_map("artisti", "codice_artista")
+        print(f"Mappati {len(artisti_map)} artisti")
         
-        artisti_map = {}
-        if response.status_code == 200:
-            artisti = response.json()
-            for artista in artisti:
-                mysql_id = artista.get('codice_artista')
-                supabase_id = artista.get('id')
-                if mysql_id and supabase_id:
-                    try:
-                        # Provare a convertire mysql_id in intero
-                        key = int(mysql_id)
-                        artisti_map[key] = supabase_id
-                    except ValueError:
-                        # Se non è un numero, mantenere come stringa
-                        artisti_map[mysql_id] = supabase_id
-            print(f"Mappati {len(artisti_map)} artisti")
-        else:
-            print(f"Errore caricamento artisti: {response.status_code}")
-            return {}, {}
-        
-        # Mappatura opere: MySQL cod_opera -> Supabase id  
+        # Mappatura opere: MySQL cod_opera -> Supabase id
         print("Caricando mappatura opere...")
-        opere_map = {}
-        offset = 0
-        limit = 1000
-        
-        while True:
-            response = requests.get(
-                f"{supabase_url}/opere",
-                headers=headers,
-                params={"select": "id,codice_opera", "limit": limit, "offset": offset}
-            )
-            
-            if response.status_code != 200:
-                print(f"Errore caricamento opere: {response.status_code}")
-                break
-            
-            opere_batch = response.json()
-            if not opere_batch:
-                break
-            
-            for opera in opere_batch:
-                mysql_id = opera.get('codice_opera')
-                supabase_id = opera.get('id')
-                if mysql_id and supabase_id:
-                    try:
-                        # Provare a convertire mysql_id in intero
-                        key = int(mysql_id)
-                        opere_map[key] = supabase_id
-                    except ValueError:
-                        # Se non è un numero, mantenere come stringa
-                        opere_map[mysql_id] = supabase_id
-            
-            print(f"Caricate {len(opere_batch)} opere (totale: {len(opere_map)})")
-            offset += limit
-            
-            # Se il batch è più piccolo del limite, abbiamo finito
-            if len(opere_batch) < limit:
-                break
-        
+        opere_map = load_code_map("opere", "codice_opera")
         print(f"Mappate {len(opere_map)} opere totali")
         
         return artisti_map, opere_map
@@ -133,131 +126,149 @@ def create_ruolo_mapping(ruoli_supabase):
     
     for ruolo in ruoli_supabase:
         nome = ruolo.get('nome', '').lower()
-        ruolo_id = ruolo.get('id')
         
         # Mappare i ruoli MySQL ai ruoli Supabase basandosi sui nomi
-        if nome == 'protagonista primario':
-            ruolo_map['Primario'] = ruolo_id
-        elif nome == 'comprimario primario':
-            ruolo_map['Comprimario'] = ruolo_id
-        elif nome == 'doppiatore primario':
-            ruolo_map['Doppiatore Primario'] = ruolo_id
-        elif nome == 'doppiatore secondario':
-            ruolo_map['Doppiatore Comprimario'] = ruolo_id
-        elif nome == 'direzione doppiaggio':
-            ruolo_map['Direzione Doppiaggio'] = ruolo_id
+        if nome in RUOLI_MYSQL:
+            ruolo_map[RUOLI_MYSQL[nome]] = ruolo.get('id')
     
     return ruolo_map
 
-def extract_partecipazioni():
-    """Estrarre le partecipazioni da MySQL"""
-    try:
-        conn = mysql.connector.connect(**mysql_config)
-        cursor = conn.cursor(dictionary=True)
-        
-        # Estrarre tutti i dati da newRuoli
-        print("Estraendo partecipazioni da MySQL...")
-        cursor.execute("""
-            SELECT 
-                idRel,
-                codOpera,
-                codArtista,
-                ruolo
-            FROM newRuoli
-            ORDER BY idRel
-        """)
-        
-        partecipazioni = cursor.fetchall()
-        print(f"Estratte {len(partecipazioni)} partecipazioni")
-        
-        # Analizzare i ruoli disponibili
-        ruoli_count = defaultdict(int)
-        for p in partecipazioni:
-            ruoli_count[p['ruolo']] += 1
-        
-        print("Distribuzione ruoli:")
-        for ruolo, count in ruoli_count.items():
-            print(f"  {ruolo}: {count}")
+def extract_partecipazioni(batch_size=1000, after_id=None):
+    """
+    Estrarre in streaming le partecipazioni da MySQL, a blocchi di batch_size righe.
+    Con after_id si riparte dalle righe con idRel > after_id.
+    """
+    print("Estraendo partecipazioni da MySQL in streaming...")
+    where = "WHERE idRel > %s" if after_id is not None else ""
+    params = (after_id,) if after_id is not None else None
+    yield from iter_batches(mysql_config, f"""
+        SELECT 
+            idRel,
+            codOpera,
+            codArtista,
+            ruolo
+        FROM newRuoli
+        {where}
+        ORDER BY idRel
+    """, params, batch_size=batch_size)
+
+def build_partecipazione(partecipazione, artisti_map, opere_map, ruolo_map):
+    """Creare il record Supabase di una partecipazione MySQL, None se mancano mappature"""
+    mysql_artista = partecipazione['codArtista']
+    mysql_opera = partecipazione['codOpera']
+    mysql_ruolo = partecipazione['ruolo']
+    
+    # Verificare che esistano le mappature
+    if mysql_artista not in artisti_map or mysql_opera not in opere_map:
+        return None
+    
+    ruolo_id = ruolo_map.get(mysql_ruolo)
+    
+    # Se non abbiamo mappatura, saltare questo record
+    if not ruolo_id:
+        return None
+    
+    return {
+        'artista_id': artisti_map[mysql_artista],
+        'opera_id': opere_map[mysql_opera],
+        'ruolo_id': ruolo_id,
+        'note': f"Ruolo MySQL: {mysql_ruolo}"  # Memorizzare il ruolo originale nelle note
+    }
+
+def map_partecipazione(partecipazione, artisti_map, opere_map, ruolo_map):
+    """(ruolo MySQL, record Supabase o None) per una riga di newRuoli"""
+    return partecipazione['ruolo'], build_partecipazione(partecipazione, artisti_map, opere_map, ruolo_map)
+
+def map_partecipazioni(partecipazioni_batches, artisti_map, opere_map, ruolo_map):
+    """Mappare in questo processo i blocchi estratti in sequenza: genera (idRel, (ruolo, record))"""
+    for rows in partecipazioni_batches:
+        for partecipazione in rows:
+            yield partecipazione['idRel'], map_partecipazione(partecipazione, artisti_map, opere_map, ruolo_map)
+
+def extract_partecipazioni_sharded(workers, artisti_map, opere_map, ruolo_map):
+    """
+    Estrarre e mappare newRuoli in `workers` processi, uno per intervallo di idRel.
+    Genera (idRel, (ruolo, record)) come map_partecipazioni, ma non in ordine di idRel.
+    """
+    transform = partial(map_partecipazione, artisti_map=artisti_map, opere_map=opere_map, ruolo_map=ruolo_map)
+    for batch in iter_sharded(mysql_config, "newRuoli", "idRel", transform, workers,
+                              columns="idRel, codOpera, codArtista, ruolo"):
+        yield from batch
+
+def iter_records(mapped, stats):
+    """Generare (idRel, record) per le partecipazioni mappabili, aggiornando stats"""
+    for id_rel, (ruolo, record) in mapped:
+        stats['extracted'] += 1
+        stats['ruoli'][ruolo] += 1
         
-        cursor.close()
-        conn.close()
+        if record is None:
+            stats['skipped'] += 1
+            continue
         
-        return partecipazioni
+        yield id_rel, record
+
+def upload_records(records, concurrency, checkpoint=None):
+    """Inviare i record via PostgREST, con batch adattivi e concorrenti"""
+    print(f"\nMigrando partecipazioni in Supabase ({concurrency} batch in parallelo)...")
+    
+    # La dimensione dei batch parte da 100 e si adatta a payload e latenza
+    sizer = AdaptiveBatchSize(initial=100)
+    pending = []
+    last_id = None
+    
+    url = f"{supabase_url}/partecipazioni?on_conflict={','.join(PARTECIPAZIONE_KEY)}"
+    upload_headers = {**headers, "Prefer": "resolution=ignore-duplicates,return=minimal"}
+    
+    with BatchUploader(url, upload_headers, max_in_flight=concurrency, sizer=sizer, checkpoint=checkpoint) as uploader:
+        for last_id, record in records:
+            pending.append(record)
+            if len(pending) >= sizer.size:
+                uploader.submit(pending, key=last_id)
+                pending = []
         
-    except Exception as e:
-        print(f"Errore estrazione partecipazioni: {e}")
-        return []
+        uploader.submit(pending, key=last_id)
+    
+    uploader.print_summary()
+    return uploader.inserted_rows
+
+def copy_records_to_postgres(records, db_url, checkpoint=None):
+    """Caricare i record con COPY diretto su PostgreSQL, in una sola transazione"""
+    print("\nMigrando partecipazioni in PostgreSQL con COPY...")
+    _, previous = checkpoint.resume_key() if checkpoint else (None, {})
+    copied, written, last_id = copy_records(db_url, "partecipazioni", PARTECIPAZIONE_COLUMNS, records,
+                                            conflict_key=PARTECIPAZIONE_KEY, ignore_duplicates=True)
+    
+    if checkpoint and last_id is not None:
+        checkpoint.save(last_id, inserted=previous.get('inserted', 0) + written)
+    
+    print(f"Record copiati: {copied}, inseriti: {written}")
+    return written
 
-def migrate_partecipazioni(partecipazioni, artisti_map, opere_map, ruolo_map):
-    """Migrare le partecipazioni in Supabase"""
+def migrate_partecipazioni(mapped, concurrency=DEFAULT_MAX_IN_FLIGHT, backend="rest", db_url=None, checkpoint=None):
+    """
+    Migrare le partecipazioni man mano che arrivano da MySQL.
+    mapped: (idRel, (ruolo, record)) da map_partecipazioni o extract_partecipazioni_sharded;
+    checkpoint va passato solo se mapped è in ordine di idRel.
+    """
     try:
-        print(f"\nMigrando {len(partecipazioni)} partecipazioni in Supabase...")
+        stats = {'extracted': 0, 'skipped': 0, 'ruoli': defaultdict(int)}
+        records = iter_records(mapped, stats)
         
-        batch_data = []
-        skipped_count = 0
-        
-        for partecipazione in partecipazioni:
-            mysql_artista = partecipazione['codArtista']
-            mysql_opera = partecipazione['codOpera']
-            mysql_ruolo = partecipazione['ruolo']
-            
-            # Verificare che esistano le mappature
-            if mysql_artista not in artisti_map:
-                skipped_count += 1
-                continue
-                
-            if mysql_opera not in opere_map:
-                skipped_count += 1
-                continue
-            
-            # Mappare gli ID
-            artista_id = artisti_map[mysql_artista]
-            opera_id = opere_map[mysql_opera]
-            ruolo_id = ruolo_map.get(mysql_ruolo)
-            
-            # Creare il record per Supabase
-            record = {
-                'artista_id': artista_id,
-                'opera_id': opera_id,
-                'ruolo_id': ruolo_id,  # Questo ora dovrebbe essere mappato correttamente
-                'note': f"Ruolo MySQL: {mysql_ruolo}",  # Memorizzare il ruolo originale nelle note
-                'stato_validazione': 'validato'  # Usare un valore valido dell'enum
-            }
-            
-            # Se non abbiamo mappatura, saltare questo record
-            if not ruolo_id:
-                skipped_count += 1
-                continue
-            
-            batch_data.append(record)
-        
-        print(f"Record da inserire: {len(batch_data)}")
-        print(f"Record saltati (mancano mappature): {skipped_count}")
+        if backend == "copy":
+            inserted = copy_records_to_postgres(records, db_url, checkpoint)
+        else:
+            inserted = upload_records(records, concurrency, checkpoint)
         
-        # Inserire in batch
-        batch_size = 100
-        total_inserted = 0
+        print(f"\nEstratte {stats['extracted']} partecipazioni")
+        print("Distribuzione ruoli:")
+        for ruolo, count in stats['ruoli'].items():
+            print(f"  {ruolo}: {count}")
+        print(f"Record saltati (mancano mappature): {stats['skipped']}")
         
-        for i in range(0, len(batch_data), batch_size):
-            batch = batch_data[i:i + batch_size]
-            
-            try:
-                response = requests.post(
-                    f"{supabase_url}/partecipazioni",
-                    headers=headers,
-                    json=batch
-                )
-                
-                if response.status_code in [200, 201]:
-                    total_inserted += len(batch)
-                    print(f"Inserito batch {i//batch_size + 1}: {len(batch)} record (totale: {total_inserted})")
-                else:
-                    print(f"Errore batch {i//batch_size + 1}: {response.status_code} - {response.text}")
-                    
-            except Exception as e:
-                print(f"Errore inserimento batch {i//batch_size + 1}: {e}")
+        if not stats['extracted']:
+            print("✗ Nessuna partecipazione trovata")
         
-        return total_inserted
+        return inserted
         
     except Exception as e:
         print(f"Errore migrazione partecipazioni: {e}")
@@ -267,7 +278,7 @@ def verify_partecipazioni():
     """Verificare le partecipazioni migrate"""
     try:
         # Contare le partecipazioni
-        response = requests.head(
+        response = session.head(
             f"{supabase_url}/partecipazioni",
             headers={**headers, "Prefer": "count=exact"}
         )
@@ -279,7 +290,7 @@ def verify_partecipazioni():
                 print(f"\nTotale partecipazioni in Supabase: {total_count}")
         
         # Ottenere alcuni esempi
-        response = requests.get(
+        response = session.get(
             f"{supabase_url}/partecipazioni",
             headers=headers,
             params={
@@ -309,6 +320,21 @@ def verify_partecipazioni():
         return False
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Migrazione partecipazioni da MySQL a Supabase")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_MAX_IN_FLIGHT,
+                        help="numero di batch inviati in parallelo")
+    parser.add_argument("--resume", action="store_true",
+                        help="riprendere dopo l'ultimo idRel salvato nel checkpoint")
+    parser.add_argument("--backend", choices=["rest", "copy"], default="rest",
+                        help="caricare via batch PostgREST o con COPY diretto su PostgreSQL")
+    parser.add_argument("--db-url", default=default_db_url(),
+                        help="connection string PostgreSQL per --backend copy (default: $SUPABASE_DB_URL)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="estrarre e mappare intervalli di idRel in N processi paralleli")
+    args = parser.parse_args()
+    if args.workers > 1 and args.resume:
+        parser.error("--resume non è supportato con --workers > 1 (i shard non finiscono in ordine di idRel)")
+    
     print("Migrazione partecipazioni da MySQL a Supabase...\n")
     
     # Step 1: Verificare tabella ruoli
@@ -327,14 +353,24 @@ if __name__ == "__main__":
     ruolo_map = create_ruolo_mapping(ruoli_supabase)
     print(f"Mappatura ruoli: {ruolo_map}")
     
-    # Step 4: Estrarre partecipazioni da MySQL
-    partecipazioni = extract_partecipazioni()
-    if not partecipazioni:
-        print("✗ Nessuna partecipazione trovata")
-        exit(1)
+    # Step 4: Estrarre partecipazioni da MySQL (in streaming, consumate dal passo successivo)
+    run_checkpoint = None
+    if args.workers > 1:
+        checkpoint.clear()
+        partecipazioni = extract_partecipazioni_sharded(args.workers, artisti_map, opere_map, ruolo_map)
+    else:
+        after_id = None
+        if args.resume:
+            after_id, state = checkpoint.resume_key()
+            if after_id is not None:
+                print(f"Ripresa dopo idRel {after_id} ({state.get('inserted', 0)} partecipazioni già inserite)")
+        else:
+            checkpoint.clear()
+        run_checkpoint = checkpoint
+        partecipazioni = map_partecipazioni(extract_partecipazioni(after_id=after_id), artisti_map, opere_map, ruolo_map)
     
     # Step 5: Migrare partecipazioni
-    migrated_count = migrate_partecipazioni(partecipazioni, artisti_map, opere_map, ruolo_map)
+    migrated_count = migrate_partecipazioni(partecipazioni, args.concurrency, args.backend, args.db_url, run_checkpoint)
     
     # Step 6: Verificare risultati
     if migrated_count > 0:
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Riconciliazione MySQL -> PostgreSQL (Supabase) di opere, artisti e partecipazioni.
+
+Confronta le due basi dati con hash per intervalli di chiave (common.reconcile)
+e riporta, per entità, le chiavi mancanti in PostgreSQL, quelle con dati
+diversi e quelle presenti solo in PostgreSQL. Con --apply inserisce o
+aggiorna opere e artisti (upsert su codice_opera / codice_artista), con
+--apply-deletes elimina anche quelli non più presenti in MySQL.
+Le partecipazioni sono solo riportate: in PostgreSQL non hanno una chiave
+MySQL su cui fare upsert (usare migrate_partecipazioni.py / sync_deletions.py).
+
+Richiede le migrazioni 20261018130000_reconcile_range_hashes.sql e
+20261018200000_reconcile_range_pushdown.sql.
+"""
+
+import os
+import sys
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.postgrest import get_session, rest_url, service_headers
+from common.mysql_stream import iter_batches
+from common.batching import AdaptiveBatchSize, sized_batches
+from common.uploader import BatchUploader, DEFAULT_MAX_IN_FLIGHT
+from common.reconcile import EntitySpec, reconcile
+from migrate_artists import map_artist
+from migrate_opere import map_opera, mysql_config
+from migrate_partecipazioni import RUOLI_MYSQL
+
+# Le colonne MySQL devono produrre lo stesso testo delle colonne confrontate
+# da reconcile_rows() in PostgreSQL (stesso ordine, stessa formattazione)
+ENTITIES = {
+    'opere': EntitySpec('opere', 'opere', 'cod_opera', [
+        'titolo',
+        'titolo_orig',
+        # map_opera: int(anno) se valorizzato, altrimenti NULL
+        'CAST(NULLIF(CAST(anno AS SIGNED), 0) AS CHAR)',
+        # map_opera: [regia] se valorizzata, altrimenti []
+        "NULLIF(regia, '')",
+        'cod_isan',
+        'produttore',
+    ]),
+    'artisti': EntitySpec('artisti', 'artisti', 'cod_artista', [
+        'cf',
+        # mysql-connector sostituisce solo %s: gli altri % arrivano a MySQL così come sono
+        "DATE_FORMAT(nascita, '%Y-%m-%d')",
+        'nconst',
+    ]),
+    # Solo le righe che migrate_partecipazioni.py scrive davvero: ruoli mappati,
+    # artista e opera esistenti, una riga per chiave naturale (la prima per idRel,
+    # le altre sono saltate da ON CONFLICT DO NOTHING)
+    'partecipazioni': EntitySpec('partecipazioni', 'newRuoli', 'codOpera', [
+        'codArtista',
+        'ruolo',
+    ], where=(
+        f"ruolo IN ({', '.join(repr(ruolo) for ruolo in RUOLI_MYSQL.values())}) "
+        "AND EXISTS (SELECT 1 FROM artisti WHERE artisti.cod_artista = newRuoli.codArtista) "
+        "AND EXISTS (SELECT 1 FROM opere WHERE opere.cod_opera = newRuoli.codOpera) "
+        "AND NOT EXISTS (SELECT 1 FROM newRuoli d WHERE d.codOpera = newRuoli.codOpera "
+        "AND d.codArtista = newRuoli.codArtista AND d.ruolo = newRuoli.ruolo AND d.idRel < newRuoli.idRel)"
+    )),
+}
+
+# Come applicare le differenze: (tabella PostgreSQL, colonna codice, mapper MySQL -> record)
+APPLIERS = {
+    'opere': ('opere', 'codice_opera', map_opera),
+    'artisti': ('artisti', 'codice_artista', map_artist),
+}
+
+KEYS_PER_QUERY = 1000
+
+
+def fetch_mapped(spec, keys, mapper):
+    """Righe MySQL con chiave in keys, mappate nei record PostgreSQL"""
+    for i in range(0, len(keys), KEYS_PER_QUERY):
+        chunk = keys[i:i + KEYS_PER_QUERY]
+        placeholders = ", ".join(["%s"] * len(chunk))
+        query = f"SELECT * FROM {spec.table} WHERE {spec.key} IN ({placeholders}) ORDER BY {spec.key}"
+        for rows in iter_batches(mysql_config, query, chunk):
+            for row in rows:
+                yield mapper(row)
+
+
+def apply_upserts(entity, keys, concurrency):
+    """Inserisce o aggiorna in PostgreSQL le righe MySQL con chiave in keys"""
+    table, code_column, mapper = APPLIERS[entity]
+    url = f"{rest_url()}/{table}?on_conflict={code_column}"
+    headers = service_headers(Prefer="resolution=merge-duplicates,return=minimal")
+
+    sizer = AdaptiveBatchSize(initial=50)
+    with BatchUploader(url, headers, max_in_flight=concurrency, sizer=sizer) as uploader:
+        for batch in sized_batches(fetch_mapped(ENTITIES[entity], keys, mapper), sizer):
+            uploader.submit(batch)
+
+    uploader.print_summary()
+    return uploader.inserted_rows
+
+
+def apply_deletes(entity, keys):
+    """Elimina da PostgreSQL le righe con codice in keys"""
+    table, code_column, _ = APPLIERS[entity]
+    session = get_session()
+    deleted = 0
+
+    for i in range(0, len(keys), 200):
+        chunk = keys[i:i + 200]
+        response = session.delete(
+            f"{rest_url()}/{table}",
+            headers=service_headers(Prefer="return=minimal,count=exact"),
+            params={code_column: f"in.({','.join(str(key) for key in chunk)})"}
+        )
+        if response.ok:
+            total = response.headers.get("Content-Range", "").rpartition("/")[2]
+            deleted += int(total) if total.isdigit() else len(chunk)
+        else:
+            # Tipicamente un vincolo FK: righe ancora referenziate da partecipazioni/individuazioni
+            print(f"   ❌ Errore eliminazione {table}: {response.status_code} - {response.text}")
+
+    return deleted
+
+
+def print_keys(label, keys, limit=20):
+    print(f"   {label}: {len(keys)}")
+    if keys:
+        sample = ", ".join(str(key) for key in keys[:limit])
+        print(f"      {sample}{' ...' if len(keys) > limit else ''}")
+
+
+def reconcile_entity(entity, args):
+    spec = ENTITIES[entity]
+    print("=" * 70)
+    print(f"Riconciliazione {entity} ({spec.table}.{spec.key})")
+    print("=" * 70)
+
+    result = reconcile(mysql_config, spec, fanout=args.fanout, leaf_size=args.leaf_size)
+
+    print(f"\n📊 {result.compared_ranges} intervalli confrontati con {result.hash_queries} query di hash, "
+          f"{result.leaf_rows} righe foglia lette")
+    if not result:
+        print("✅ MySQL e PostgreSQL coincidono")
+        return result
+
+    print_keys("🟢 Mancanti in PostgreSQL", result.missing)
+    print_keys("🟡 Diverse", result.changed)
+    print_keys("🔴 Solo in PostgreSQL", result.extra)
+
+    if entity not in APPLIERS:
+        if args.apply or args.apply_deletes:
+            print(f"   ⚠️  {entity}: solo report, nessuna modifica applicata")
+        return result
+
+    if args.apply and (result.missing or result.changed):
+        print(f"\n✏️  Upsert di {len(result.missing) + len(result.changed)} {entity}...")
+        apply_upserts(entity, result.missing + result.changed, args.concurrency)
+
+    if args.apply_deletes and result.extra:
+        print(f"\n🗑️  Eliminazione di {len(result.extra)} {entity}...")
+        deleted = apply_deletes(entity, result.extra)
+        print(f"   ✅ Eliminati {deleted}")
+
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Riconcilia MySQL e Supabase con hash per intervalli di chiave")
+    parser.add_argument("entities", nargs="*", default=list(ENTITIES), metavar="ENTITÀ",
+                        help=f"entità da riconciliare: {', '.join(ENTITIES)} (default: tutte)")
+    parser.add_argument("--apply", action="store_true",
+                        help="inserisce/aggiorna in PostgreSQL le righe mancanti o diverse (opere, artisti)")
+    parser.add_argument("--apply-deletes", action="store_true",
+                        help="elimina da PostgreSQL le righe non più presenti in MySQL (opere, artisti)")
+    parser.add_argument("--fanout", type=int, default=16,
+                        help="sotto-intervalli per ogni intervallo diverso (default: %(default)s)")
+    parser.add_argument("--leaf-size", type=int, default=256,
+                        help="righe sotto le quali un intervallo viene confrontato riga per riga (default: %(default)s)")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_MAX_IN_FLIGHT,
+                        help="batch di upsert in parallelo")
+    args = parser.parse_args()
+    unknown = [entity for entity in args.entities if entity not in ENTITIES]
+    if unknown:
+        parser.error(f"entità sconosciute: {', '.join(unknown)}")
+
+    differences = 0
+    for entity in args.entities:
+        result = reconcile_entity(entity, args)
+        differences += len(result.missing) + len(result.changed) + len(result.extra)
+        print()
+
+    sys.exit(1 if differences and not (args.apply or args.apply_deletes) else 0)
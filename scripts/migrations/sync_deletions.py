@@ -6,9 +6,21 @@ Elimina le partecipazioni in PostgreSQL il cui id_opera_staging non esiste più
 """
 
 import mysql.connector
-import requests
+import sys
 import json
-import time
+import argparse
+import base64
+import hashlib
+import zlib
+from datetime import datetime, timezone
+from itertools import islice
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.postgrest import get_session, iter_keyset
+from common.mysql_stream import iter_batches
+from common.batching import AdaptiveBatchSize, send_adaptive
+from common.idset import IdSet
+from common.checkpoint import STATE_DIR, Checkpoint
 
 # MySQL connection details (da migrate_partecipazioni.py)
 mysql_config = {
@@ -30,6 +42,17 @@ supabase_headers = {
     "Prefer": "return=representation"
 }
 
+session = get_session()
+
+DEFAULT_DIFF_PATH = os.path.join(STATE_DIR, "sync_deletions.diff.json")
+DEFAULT_DIFF_MAX_AGE_MINUTES = 60
+
+# Journal di --execute: il piano (staging ID approvati, nel formato del diff)
+# e l'ultimo staging ID il cui batch è stato confermato
+PLAN_PATH = os.path.join(STATE_DIR, "sync_deletions.plan.json")
+journal = Checkpoint("sync_deletions", "id_opera_staging")
+DEFAULT_EXECUTE_BATCH_SIZE = 1000
+
 
 def get_mysql_opera_ids():
     """
@@ -44,163 +67,243 @@ def get_mysql_opera_ids():
         # Estrarre tutti gli id_opera dalla tabella Opere (con O maiuscola)
         cursor.execute("SELECT id_opera FROM Opere ORDER BY id_opera")
         
-        mysql_ids = set()
-        for (id_opera,) in cursor:
-            mysql_ids.add(id_opera)
+        mysql_ids = IdSet(id_opera for (id_opera,) in cursor)
         
         cursor.close()
         conn.close()
         
         print(f"✅ Estratti {len(mysql_ids)} ID da MySQL")
-        print(f"   Range: {min(mysql_ids)} - {max(mysql_ids)}")
+        print(f"   Range: {mysql_ids.min()} - {mysql_ids.max()}")
         
         return mysql_ids
         
     except Exception as e:
         print(f"❌ Errore connessione MySQL: {e}")
-        return set()
+        return IdSet()
+
+
+def rpc_missing(response):
+    """True se la funzione RPC non esiste (migrazione non ancora applicata)"""
+    return response.status_code == 404 and "PGRST202" in response.text
 
 
 def get_postgresql_staging_ids():
     """
     Estrae tutti gli id_opera_staging dalle partecipazioni in PostgreSQL.
+    La RPC partecipazioni_staging_ids restituisce gli id già deduplicati in un
+    solo array; senza RPC si legge a pagine solo metadati->>id_opera_staging.
     """
     print("📥 Estrazione staging IDs da PostgreSQL...")
     
-    all_ids = set()
-    offset = 0
-    limit = 1000
+    all_ids = IdSet()
     
-    while True:
-        response = requests.get(
-            f"{SUPABASE_URL}/rest/v1/partecipazioni",
-            headers={
-                **supabase_headers, 
-                "Range": f"{offset}-{offset+limit-1}",
-                "Prefer": "count=exact"
-            },
-            params={
-                "select": "id,metadati",
-            }
-        )
-        
-        if response.status_code not in [200, 206]:
-            print(f"   Errore: {response.status_code} - {response.text}")
-            break
-        
-        data = response.json()
-        if not data:
-            break
-        
-        for record in data:
-            metadati = record.get('metadati', {})
-            if metadati and 'id_opera_staging' in metadati:
-                staging_id = int(metadati['id_opera_staging'])
-                all_ids.add(staging_id)
-        
-        print(f"   Caricati {len(all_ids)} IDs unici... (offset: {offset})")
-        offset += limit
-        
-        if len(data) < limit:
-            break
+    try:
+        response = session.post(f"{SUPABASE_URL}/rest/v1/rpc/partecipazioni_staging_ids",
+                                headers=supabase_headers, json={})
+        if not rpc_missing(response):
+            response.raise_for_status()
+            all_ids.update(response.json())
+        else:
+            print("   ⚠️  RPC partecipazioni_staging_ids non disponibile, lettura a pagine")
+            for data in iter_keyset(f"{SUPABASE_URL}/rest/v1/partecipazioni", supabase_headers,
+                                    select="id,staging_id:metadati->>id_opera_staging",
+                                    params={"metadati->>id_opera_staging": "not.is.null"}):
+                all_ids.update(int(record['staging_id']) for record in data)
+                
+                print(f"   Caricati {len(all_ids)} IDs unici... (ultimo id: {data[-1]['id']})")
+    except Exception as e:
+        print(f"   Errore: {e}")
+        return IdSet()
     
     print(f"✅ Trovati {len(all_ids)} staging IDs unici in PostgreSQL")
     if all_ids:
-        print(f"   Range: {min(all_ids)} - {max(all_ids)}")
+        print(f"   Range: {all_ids.min()} - {all_ids.max()}")
     
     return all_ids
 
 
-def get_partecipazioni_to_delete(staging_ids_to_remove):
+def iter_mysql_opera_ids(batch_size=10000):
+    """id_opera di MySQL in ordine crescente, letti in streaming"""
+    for rows in iter_batches(mysql_config, "SELECT id_opera FROM Opere ORDER BY id_opera",
+                             batch_size=batch_size, dictionary=False):
+        for (id_opera,) in rows:
+            yield id_opera
+
+
+def iter_postgresql_staging_ids(page_size=1000):
+    """
+    Staging ID distinti di PostgreSQL in ordine crescente, a pagine keyset (RPC).
+    La RPC restituisce SETOF bigint, troncato da PostgREST a max_rows: la
+    lettura finisce solo a una pagina vuota, non a una pagina corta.
+    """
+    after = None
+    while True:
+        response = session.post(
+            f"{SUPABASE_URL}/rest/v1/rpc/partecipazioni_staging_ids_page",
+            headers=supabase_headers,
+            json={"p_after": after, "p_limit": page_size}
+        )
+        if rpc_missing(response):
+            raise RuntimeError("RPC partecipazioni_staging_ids_page non disponibile: "
+                               "applicare la migrazione 20261018140000 o usare la modalità senza --stream")
+        response.raise_for_status()
+        
+        page = response.json()
+        if not page:
+            return
+        yield from page
+        after = page[-1]
+
+
+def merge_staging_ids(mysql_ids, pg_ids, stats):
+    """
+    Merge-join di due flussi ordinati di ID: genera ('remove', id) per gli
+    staging ID assenti in MySQL e ('missing', id) per gli ID MySQL assenti in
+    PostgreSQL, non oltre l'ultimo staging ID (come il filtro su max_staging_id).
+    stats raccoglie i conteggi dei due flussi.
+    """
+    mysql_ids, pg_ids = iter(mysql_ids), iter(pg_ids)
+    mysql_id, pg_id = next(mysql_ids, None), next(pg_ids, None)
+    
+    while pg_id is not None:
+        stats['max_staging_id'] = pg_id
+        if mysql_id is None or pg_id < mysql_id:
+            stats['pg'] += 1
+            yield 'remove', pg_id
+            pg_id = next(pg_ids, None)
+        elif mysql_id < pg_id:
+            stats['mysql'] += 1
+            yield 'missing', mysql_id
+            mysql_id = next(mysql_ids, None)
+        else:
+            stats['pg'] += 1
+            stats['mysql'] += 1
+            pg_id, mysql_id = next(pg_ids, None), next(mysql_ids, None)
+
+
+def stream_ids_to_remove(show=30):
+    """
+    Diff in streaming tra MySQL e PostgreSQL (memoria costante nei due flussi):
+    stampa gli ID da eliminare appena trovati e restituisce (IdSet degli ID da
+    eliminare, numero di ID MySQL mancanti in PG, stats dei flussi).
+    """
+    print("🔀 Merge-join in streaming di MySQL (id_opera) e PostgreSQL (staging IDs)...")
+    
+    stats = {'mysql': 0, 'pg': 0, 'max_staging_id': None}
+    ids_to_remove = IdSet()
+    removed = 0
+    missing_in_pg = 0
+    
+    for kind, id in merge_staging_ids(iter_mysql_opera_ids(), iter_postgresql_staging_ids(), stats):
+        if kind == 'missing':
+            missing_in_pg += 1
+            continue
+        ids_to_remove.add(id)
+        # Contatore semplice: len() dell'IdSet conta tutti i bit a ogni chiamata
+        removed += 1
+        if removed <= show:
+            print(f"      - {id} da eliminare")
+    
+    return ids_to_remove, missing_in_pg, stats
+
+
+def get_partecipazioni_to_delete(staging_ids_to_remove, chunk_size=200, errors=None):
     """
     Recupera gli ID delle partecipazioni da eliminare.
+    Gli staging id sono interrogati a blocchi con metadati->>id_opera_staging=in.(...)
+    (indice di espressione idx_partecipazioni_id_opera_staging), ogni blocco
+    letto a pagine keyset. I blocchi falliti vengono aggiunti a errors.
     """
     print(f"🔍 Cercando partecipazioni con staging IDs da eliminare...")
     
     partecipazioni_ids = []
+    staging_ids = list(staging_ids_to_remove)
     
-    for staging_id in staging_ids_to_remove:
-        # Nota: Supabase non supporta direttamente query su JSONB con operatori complessi via REST
-        # Dobbiamo fare una query per ogni staging_id o usare RPC
-        response = requests.get(
-            f"{SUPABASE_URL}/rest/v1/partecipazioni",
-            headers=supabase_headers,
-            params={
-                "select": "id",
-                "metadati->>id_opera_staging": f"eq.{staging_id}"
-            }
-        )
+    for i in range(0, len(staging_ids), chunk_size):
+        chunk = staging_ids[i:i + chunk_size]
+        # ->> restituisce testo: il confronto in.(...) avviene sulle stringhe degli id
+        params = {"metadati->>id_opera_staging": f"in.({','.join(str(id) for id in chunk)})"}
         
-        if response.status_code == 200:
-            records = response.json()
-            for record in records:
-                partecipazioni_ids.append(record['id'])
+        try:
+            for records in iter_keyset(f"{SUPABASE_URL}/rest/v1/partecipazioni", supabase_headers,
+                                       select="id", params=params):
+                partecipazioni_ids.extend(record['id'] for record in records)
+        except Exception as e:
+            print(f"   ❌ Errore ricerca staging IDs {chunk[0]}-{chunk[-1]}: {e}")
+            if errors is not None:
+                errors.append(f"ricerca staging IDs {chunk[0]}-{chunk[-1]}: {e}")
         
+        print(f"   Controllati {min(i + chunk_size, len(staging_ids))}/{len(staging_ids)} staging IDs... "
+              f"({len(partecipazioni_ids)} partecipazioni)")
+    
     return partecipazioni_ids
 
 
-def delete_individuazioni_for_partecipazioni(partecipazione_ids):
+def deleted_count(response, fallback):
+    """Numero di righe eliminate da Content-Range (count=exact), es. '*/42'"""
+    total = response.headers.get("Content-Range", "").rpartition("/")[2]
+    return int(total) if total.isdigit() else fallback
+
+
+def delete_by_ids(table, ids, column="id", show_progress=False, errors=None):
     """
-    Elimina le individuazioni collegate alle partecipazioni da eliminare.
+    Elimina le righe di table con column in ids, in batch di dimensione adattiva:
+    si parte da 50 id, si cresce finché le richieste sono veloci e su
+    413/414/timeout il batch viene dimezzato e ritentato.
+    Le righe eliminate non vengono restituite: il conteggio arriva da count=exact.
+    I batch falliti vengono aggiunti a errors.
     """
-    if not partecipazione_ids:
-        return 0
-    
-    print(f"🔍 Cercando individuazioni collegate alle {len(partecipazione_ids)} partecipazioni...")
-    
-    # Trova le individuazioni collegate
-    individuazioni_to_delete = []
+    # Gli id finiscono nella query string: il limite in byte è quello dell'URL
+    sizer = AdaptiveBatchSize(initial=50, max_size=500, max_bytes=8000)
+    total_deleted = 0
+    i = 0
     
-    for part_id in partecipazione_ids:
-        response = requests.get(
-            f"{SUPABASE_URL}/rest/v1/individuazioni",
-            headers=supabase_headers,
+    while i < len(ids):
+        batch = ids[i:i + sizer.size]
+        i += len(batch)
+        
+        results = send_adaptive(batch, sizer, lambda chunk: session.delete(
+            f"{SUPABASE_URL}/rest/v1/{table}",
+            headers={**supabase_headers, "Prefer": "return=minimal,count=exact"},
             params={
-                "select": "id",
-                "partecipazione_id": f"eq.{part_id}"
+                column: f"in.({','.join(str(id) for id in chunk)})"
             }
-        )
+        ))
+        
+        for chunk, response, error in results:
+            if error is None:
+                total_deleted += deleted_count(response, len(chunk))
+            else:
+                print(f"   ❌ Errore eliminazione {table}: {error}")
+                if errors is not None:
+                    errors.append(f"eliminazione di {len(chunk)} {table}: {error}")
         
-        if response.status_code == 200:
-            records = response.json()
-            for record in records:
-                individuazioni_to_delete.append(record['id'])
+        if show_progress:
+            print(f"   ✅ Eliminati {total_deleted}/{len(ids)}... (batch: {sizer.size})")
     
-    if not individuazioni_to_delete:
-        print("   ✅ Nessuna individuazione collegata")
+    return total_deleted
+
+
+def delete_individuazioni_for_partecipazioni(partecipazione_ids, errors=None):
+    """
+    Elimina le individuazioni collegate alle partecipazioni da eliminare,
+    con DELETE filtrati per partecipazione_id=in.(...) senza leggerle prima.
+    """
+    if not partecipazione_ids:
         return 0
     
-    print(f"   🗑️  Eliminando {len(individuazioni_to_delete)} individuazioni collegate...")
-    
-    # Elimina le individuazioni
-    total_deleted = 0
-    batch_size = 50
+    print(f"🗑️  Eliminando le individuazioni collegate alle {len(partecipazione_ids)} partecipazioni...")
     
-    for i in range(0, len(individuazioni_to_delete), batch_size):
-        batch = individuazioni_to_delete[i:i+batch_size]
-        ids_str = ",".join(batch)
-        
-        response = requests.delete(
-            f"{SUPABASE_URL}/rest/v1/individuazioni",
-            headers={**supabase_headers, "Prefer": "return=representation"},
-            params={
-                "id": f"in.({ids_str})"
-            }
-        )
-        
-        if response.status_code in [200, 204]:
-            deleted = len(response.json()) if response.text else len(batch)
-            total_deleted += deleted
-        else:
-            print(f"   ❌ Errore eliminazione individuazioni: {response.status_code} - {response.text}")
-        
-        time.sleep(0.1)
+    total_deleted = delete_by_ids("individuazioni", partecipazione_ids, column="partecipazione_id", errors=errors)
     
-    print(f"   ✅ Eliminate {total_deleted} individuazioni")
+    if total_deleted:
+        print(f"   ✅ Eliminate {total_deleted} individuazioni")
+    else:
+        print("   ✅ Nessuna individuazione collegata")
     return total_deleted
 
 
-def delete_partecipazioni_batch(partecipazione_ids):
+def delete_partecipazioni_batch(partecipazione_ids, errors=None):
     """
     Elimina le partecipazioni per ID in batch.
     """
@@ -210,46 +313,196 @@ def delete_partecipazioni_batch(partecipazione_ids):
     
     print(f"🗑️  Eliminando {len(partecipazione_ids)} partecipazioni...")
     
-    total_deleted = 0
-    batch_size = 50
+    return delete_by_ids("partecipazioni", partecipazione_ids, show_progress=True, errors=errors)
+
+
+def sync_deletions_cascade(staging_ids_to_remove):
+    """
+    Esegue la cascata di eliminazione lato server (RPC sync_deletions_cascade):
+    individuazioni e partecipazioni degli staging id rimossi in un'unica transazione.
+    Restituisce i conteggi per tabella, o None se la funzione non è disponibile.
+    """
+    print(f"🗑️  Eliminazione server-side per {len(staging_ids_to_remove)} staging IDs...")
     
-    for i in range(0, len(partecipazione_ids), batch_size):
-        batch = partecipazione_ids[i:i+batch_size]
-        
-        # Creare la lista di ID per il filtro
-        ids_str = ",".join(batch)
-        
-        response = requests.delete(
-            f"{SUPABASE_URL}/rest/v1/partecipazioni",
-            headers={**supabase_headers, "Prefer": "return=representation"},
-            params={
-                "id": f"in.({ids_str})"
-            }
-        )
+    response = session.post(
+        f"{SUPABASE_URL}/rest/v1/rpc/sync_deletions_cascade",
+        headers=supabase_headers,
+        json={"p_staging_ids": list(staging_ids_to_remove)}
+    )
+    
+    if rpc_missing(response):
+        print("   ⚠️  RPC sync_deletions_cascade non disponibile, uso la cascata via REST")
+        return None
+    
+    response.raise_for_status()
+    return response.json()
+
+
+def delete_via_rest(staging_ids_to_remove):
+    """
+    Cascata di eliminazione via REST (partecipazioni, poi individuazioni
+    collegate, poi partecipazioni), per database senza la RPC.
+    Solleva RuntimeError se una ricerca o un'eliminazione fallisce, così il
+    batch non viene segnato come eseguito nel journal.
+    """
+    errors = []
+    partecipazioni_ids = get_partecipazioni_to_delete(staging_ids_to_remove, errors=errors)
+    if errors:
+        raise RuntimeError(f"{len(errors)} ricerche fallite, nessuna eliminazione eseguita: {errors[0]}")
+    print(f"\n📋 Trovate {len(partecipazioni_ids)} partecipazioni da eliminare")
+    
+    if not partecipazioni_ids:
+        print("✅ Nessuna partecipazione trovata con questi staging IDs")
+        return {"individuazioni": 0, "partecipazioni": 0}
+    
+    # Prima eliminare le individuazioni collegate (per rispettare i vincoli FK)
+    print()
+    individuazioni_deleted = delete_individuazioni_for_partecipazioni(partecipazioni_ids, errors)
+    if errors:
+        # Le partecipazioni ancora referenziate violerebbero il vincolo FK
+        raise RuntimeError(f"{len(errors)} eliminazioni di individuazioni fallite: {errors[0]}")
+    
+    print()
+    deleted_count = delete_partecipazioni_batch(partecipazioni_ids, errors)
+    if errors:
+        raise RuntimeError(f"{len(errors)} eliminazioni di partecipazioni fallite: {errors[0]}")
+    
+    return {"individuazioni": individuazioni_deleted, "partecipazioni": deleted_count}
+
+
+def diff_checksum(diff):
+    """sha256 del diff serializzato in modo canonico, escluso il campo checksum"""
+    payload = json.dumps({k: v for k, v in diff.items() if k != 'sha256'}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def write_diff(path, ids_to_remove, max_staging_id):
+    """
+    Salva gli staging ID da eliminare calcolati dal dry run: bitmap IdSet
+    compressa con zlib, in base64, con data di creazione e checksum.
+    """
+    diff = {
+        'version': 1,
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        'max_staging_id': max_staging_id,
+        'count': len(ids_to_remove),
+        'ids': base64.b64encode(zlib.compress(ids_to_remove.to_bytes(), 9)).decode("ascii"),
+    }
+    diff['sha256'] = diff_checksum(diff)
+    
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(diff, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def load_diff(path, max_age_minutes=DEFAULT_DIFF_MAX_AGE_MINUTES):
+    """
+    Carica il diff scritto dal dry run. Restituisce l'IdSet degli staging ID
+    da eliminare, o None se il file è corrotto o più vecchio di max_age_minutes.
+    """
+    try:
+        with open(path) as f:
+            diff = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"❌ Diff non leggibile ({path}): {e}")
+        return None
+    
+    if diff.get('version') != 1 or diff.get('sha256') != diff_checksum(diff):
+        print(f"❌ Checksum del diff non valido: {path}")
+        return None
+    
+    age = datetime.now(timezone.utc) - datetime.fromisoformat(diff['created_at'])
+    age_minutes = age.total_seconds() / 60
+    if age_minutes > max_age_minutes:
+        print(f"❌ Diff troppo vecchio ({age_minutes:.0f} minuti, massimo {max_age_minutes}): "
+              f"rieseguire il dry run")
+        return None
+    
+    ids_to_remove = IdSet.from_bytes(zlib.decompress(base64.b64decode(diff['ids'])))
+    if len(ids_to_remove) != diff['count']:
+        print(f"❌ Diff incoerente: {len(ids_to_remove)} ID invece di {diff['count']}")
+        return None
+    
+    print(f"📄 Diff del {diff['created_at']} ({age_minutes:.0f} minuti fa)")
+    print(f"   - Max staging ID: {diff['max_staging_id']}")
+    return ids_to_remove
+
+
+def execute_plan(ids_to_remove, batch_size=DEFAULT_EXECUTE_BATCH_SIZE, counts=None):
+    """
+    Esegue la cascata a batch di staging ID ordinati, ognuno in una propria
+    transazione (RPC) o via REST. Dopo ogni batch confermato il journal salva
+    l'ultimo staging ID, così un'interruzione riprende dal batch successivo.
+    Un batch fallito solleva l'eccezione senza avanzare il journal.
+    """
+    ids = list(ids_to_remove)
+    counts = counts or {"individuazioni": 0, "partecipazioni": 0}
+    use_rpc = True
+    
+    for i in range(0, len(ids), batch_size):
+        batch = ids[i:i + batch_size]
+        print(f"\n📦 Batch {i // batch_size + 1}/{(len(ids) + batch_size - 1) // batch_size} "
+              f"(staging IDs {batch[0]}-{batch[-1]})")
         
-        if response.status_code in [200, 204]:
-            deleted = len(response.json()) if response.text else len(batch)
-            total_deleted += deleted
-            print(f"   ✅ Eliminati {total_deleted}/{len(partecipazione_ids)}...")
-        else:
-            print(f"   ❌ Errore batch: {response.status_code} - {response.text}")
+        batch_counts = sync_deletions_cascade(batch) if use_rpc else None
+        if batch_counts is None:
+            use_rpc = False
+            batch_counts = delete_via_rest(batch)
         
-        time.sleep(0.1)  # Rate limiting
+        for table in counts:
+            counts[table] += batch_counts[table]
+        journal.save(batch[-1], **counts)
     
-    return total_deleted
+    return counts
 
 
-def main():
-    print("=" * 70)
-    print("Sincronizzazione Eliminazioni MySQL -> PostgreSQL (Partecipazioni)")
-    print("=" * 70)
-    print()
+def resume_plan():
+    """Staging ID del piano non ancora confermati e conteggi già eseguiti, o None"""
+    last_key, state = journal.resume_key()
+    if not os.path.exists(PLAN_PATH):
+        print("❌ Nessuna esecuzione interrotta da riprendere")
+        return None
+    
+    # Il piano è già stato approvato: l'età non conta
+    plan = load_diff(PLAN_PATH, max_age_minutes=float("inf"))
+    if plan is None:
+        return None
+    
+    remaining = IdSet(id for id in plan if last_key is None or id > last_key)
+    if not remaining:
+        # Interrotta dopo l'ultimo batch: resta solo da pulire il journal
+        journal.clear()
+        os.remove(PLAN_PATH)
+    counts = {"individuazioni": state.get("individuazioni", 0), "partecipazioni": state.get("partecipazioni", 0)}
+    print(f"🔁 Ripresa dopo staging ID {last_key}: {len(remaining)}/{len(plan)} staging IDs rimanenti "
+          f"({counts['partecipazioni']} partecipazioni già eliminate)")
+    return remaining, counts
+
+
+def compute_ids_to_remove(stream=False):
+    """Staging ID presenti in PostgreSQL ma non più in MySQL, o None su errore"""
+    if stream:
+        try:
+            ids_to_remove, _, stats = stream_ids_to_remove(show=0)
+        except Exception as e:
+            print(f"❌ Errore nel diff in streaming: {e}")
+            return None
+        if stats['max_staging_id'] is None:
+            print("❌ Impossibile ottenere staging IDs da PostgreSQL")
+            return None
+        print(f"📊 Analisi:")
+        print(f"   - ID MySQL (fino a {stats['max_staging_id']}): {stats['mysql']}")
+        print(f"   - Staging IDs in PostgreSQL: {stats['pg']}")
+        print(f"   - IDs da ELIMINARE: {len(ids_to_remove)}")
+        return ids_to_remove
     
     # Step 1: Ottenere gli ID da MySQL
     mysql_ids = get_mysql_opera_ids()
     if not mysql_ids:
         print("❌ Impossibile ottenere ID da MySQL")
-        return
+        return None
     
     print()
     
@@ -257,15 +510,15 @@ def main():
     pg_staging_ids = get_postgresql_staging_ids()
     if not pg_staging_ids:
         print("❌ Impossibile ottenere staging IDs da PostgreSQL")
-        return
+        return None
     
     print()
     
     # Step 3: Trovare gli IDs da eliminare (presenti in PG ma non in MySQL)
     # IMPORTANTE: Consideriamo solo gli ID fino al max di staging (34075)
     # perché quelli oltre non erano stati migrati
-    max_staging_id = max(pg_staging_ids)
-    mysql_ids_filtered = {id for id in mysql_ids if id <= max_staging_id}
+    max_staging_id = pg_staging_ids.max()
+    mysql_ids_filtered = mysql_ids.upto(max_staging_id)
     
     ids_to_remove = pg_staging_ids - mysql_ids_filtered
     
@@ -274,8 +527,36 @@ def main():
     print(f"   - Staging IDs in PostgreSQL: {len(pg_staging_ids)}")
     print(f"   - IDs da ELIMINARE: {len(ids_to_remove)}")
     
+    return ids_to_remove
+
+
+def main(from_diff=None, max_age_minutes=DEFAULT_DIFF_MAX_AGE_MINUTES, stream=False,
+         resume=False, batch_size=DEFAULT_EXECUTE_BATCH_SIZE):
+    print("=" * 70)
+    print("Sincronizzazione Eliminazioni MySQL -> PostgreSQL (Partecipazioni)")
+    print("=" * 70)
+    print()
+    
+    counts = None
+    if resume:
+        # Step 1-3: il piano e il journal dell'esecuzione interrotta sostituiscono il diff
+        resumed = resume_plan()
+        if resumed is None:
+            return
+        ids_to_remove, counts = resumed
+    elif from_diff:
+        # Step 1-3: riusare il diff calcolato dal dry run invece di rileggere i due database
+        ids_to_remove = load_diff(from_diff, max_age_minutes)
+        if ids_to_remove is None:
+            return
+        print(f"   - IDs da ELIMINARE: {len(ids_to_remove)}")
+    else:
+        ids_to_remove = compute_ids_to_remove(stream)
+        if ids_to_remove is None:
+            return
+    
     if ids_to_remove:
-        print(f"\n   Primi 20 ID da eliminare: {sorted(list(ids_to_remove))[:20]}")
+        print(f"\n   Primi 20 ID da eliminare: {list(islice(ids_to_remove, 20))}")
     
     print()
     
@@ -295,33 +576,73 @@ def main():
     
     print()
     
-    # Step 5: Trovare le partecipazioni da eliminare
-    partecipazioni_ids = get_partecipazioni_to_delete(ids_to_remove)
-    print(f"\n📋 Trovate {len(partecipazioni_ids)} partecipazioni da eliminare")
-    
-    if not partecipazioni_ids:
-        print("✅ Nessuna partecipazione trovata con questi staging IDs")
+    # Step 5: Eliminare individuazioni e partecipazioni, un batch di staging ID per transazione
+    if not resume:
+        write_diff(PLAN_PATH, ids_to_remove, ids_to_remove.max())
+        journal.clear()
+    try:
+        counts = execute_plan(ids_to_remove, batch_size, counts)
+    except Exception as e:
+        # Il journal è fermo all'ultimo batch completato: --resume riparte dal batch fallito
+        print(f"\n❌ Eliminazione interrotta: {e}")
+        print("   Rilanciare con --execute --resume per riprendere dal batch fallito")
         return
     
-    # Step 5.5: Prima eliminare le individuazioni collegate (per rispettare i vincoli FK)
+    # Esecuzione completa: niente da riprendere
+    journal.clear()
+    os.remove(PLAN_PATH)
+    
+    print()
+    print("=" * 70)
+    print(f"✅ Sincronizzazione completata!")
+    print(f"   - Individuazioni eliminate: {counts['individuazioni']}")
+    print(f"   - Partecipazioni eliminate: {counts['partecipazioni']}")
+    print("=" * 70)
+
+
+def dry_run_stream(diff_path=DEFAULT_DIFF_PATH):
+    """
+    Come dry_run, ma con il merge-join in streaming dei due database: gli ID da
+    eliminare vengono stampati appena trovati e nessuno dei due elenchi
+    completi viene caricato in memoria.
+    """
+    print("=" * 70)
+    print("DRY RUN (streaming) - Analisi Sincronizzazione (nessuna modifica)")
+    print("=" * 70)
     print()
-    individuazioni_deleted = delete_individuazioni_for_partecipazioni(partecipazioni_ids)
     
-    # Step 6: Eliminare le partecipazioni
+    try:
+        ids_to_remove, missing_in_pg, stats = stream_ids_to_remove()
+    except Exception as e:
+        print(f"❌ Errore nel diff in streaming: {e}")
+        return
+    
+    if stats['max_staging_id'] is None:
+        print("❌ Impossibile ottenere staging IDs da PostgreSQL")
+        return
+    
+    print()
+    print("📊 RIEPILOGO ANALISI:")
+    print(f"   - Max staging ID in PostgreSQL: {stats['max_staging_id']}")
+    print(f"   - ID MySQL (fino a {stats['max_staging_id']}): {stats['mysql']}")
+    print(f"   - Staging IDs in PostgreSQL: {stats['pg']}")
     print()
-    deleted_count = delete_partecipazioni_batch(partecipazioni_ids)
+    print(f"   🔴 IDs da ELIMINARE da PostgreSQL: {len(ids_to_remove)}")
+    print(f"   🟡 IDs presenti in MySQL ma non in PG: {missing_in_pg}")
+    
+    write_diff(diff_path, ids_to_remove, stats['max_staging_id'])
     
     print()
+    print(f"💾 Diff salvato in {diff_path}")
     print("=" * 70)
-    print(f"✅ Sincronizzazione completata!")
-    print(f"   - Individuazioni eliminate: {individuazioni_deleted}")
-    print(f"   - Partecipazioni eliminate: {deleted_count}")
+    print(f"Per eseguire l'eliminazione: python sync_deletions.py --execute --from-diff {diff_path}")
     print("=" * 70)
 
 
-def dry_run():
+def dry_run(diff_path=DEFAULT_DIFF_PATH):
     """
-    Esegue un'analisi senza eliminare nulla.
+    Esegue un'analisi senza eliminare nulla e salva il diff in diff_path,
+    riutilizzabile con --execute --from-diff.
     """
     print("=" * 70)
     print("DRY RUN - Analisi Sincronizzazione (nessuna modifica)")
@@ -345,8 +666,8 @@ def dry_run():
     print()
     
     # Step 3: Analisi
-    max_staging_id = max(pg_staging_ids)
-    mysql_ids_filtered = {id for id in mysql_ids if id <= max_staging_id}
+    max_staging_id = pg_staging_ids.max()
+    mysql_ids_filtered = mysql_ids.upto(max_staging_id)
     
     ids_to_remove = pg_staging_ids - mysql_ids_filtered
     ids_missing_in_pg = mysql_ids_filtered - pg_staging_ids
@@ -362,19 +683,45 @@ def dry_run():
     
     if ids_to_remove:
         print(f"\n   Esempio IDs da eliminare (primi 30):")
-        for id in sorted(list(ids_to_remove))[:30]:
+        for id in islice(ids_to_remove, 30):
             print(f"      - {id}")
     
+    write_diff(diff_path, ids_to_remove, max_staging_id)
+    
     print()
+    print(f"💾 Diff salvato in {diff_path}")
     print("=" * 70)
     print("Per eseguire l'eliminazione effettiva, eseguire: python sync_deletions.py --execute")
+    print(f"oppure, senza rileggere i database: python sync_deletions.py --execute --from-diff {diff_path}")
     print("=" * 70)
 
 
 if __name__ == "__main__":
-    import sys
-    
-    if len(sys.argv) > 1 and sys.argv[1] == '--execute':
-        main()
+    parser = argparse.ArgumentParser(description="Sincronizza le eliminazioni delle opere da MySQL a Supabase")
+    parser.add_argument("--execute", action="store_true",
+                        help="esegue le eliminazioni (default: dry run)")
+    parser.add_argument("--from-diff", nargs="?", const=DEFAULT_DIFF_PATH, metavar="FILE",
+                        help=f"con --execute, usa il diff salvato dal dry run (default: {DEFAULT_DIFF_PATH})")
+    parser.add_argument("--max-age", type=int, default=DEFAULT_DIFF_MAX_AGE_MINUTES, metavar="MINUTES",
+                        help="età massima accettata del diff, in minuti (default: %(default)s)")
+    parser.add_argument("--diff-out", default=DEFAULT_DIFF_PATH, metavar="FILE",
+                        help="dove il dry run salva il diff (default: %(default)s)")
+    parser.add_argument("--stream", action="store_true",
+                        help="diff con merge-join in streaming di MySQL e PostgreSQL (memoria costante)")
+    parser.add_argument("--resume", action="store_true",
+                        help="con --execute, riprende l'ultima esecuzione interrotta dal journal")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_EXECUTE_BATCH_SIZE,
+                        help="staging IDs eliminati per transazione (default: %(default)s)")
+    args = parser.parse_args()
+    
+    if (args.from_diff or args.resume) and not args.execute:
+        parser.error("--from-diff e --resume richiedono --execute")
+    if args.from_diff and args.resume:
+        parser.error("--resume usa il piano salvato: non combinarlo con --from-diff")
+    
+    if args.execute:
+        main(args.from_diff, args.max_age, args.stream, args.resume, args.batch_size)
+    elif args.stream:
+        dry_run_stream(args.diff_out)
     else:
-        dry_run()
+        dry_run(args.diff_out)
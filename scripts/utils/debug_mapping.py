@@ -1,7 +1,10 @@
 #!/usr/bin/env python3
 import os
 import mysql.connector
-import requests
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.postgrest import get_session
 
 # MySQL connection details
 mysql_config = {
@@ -21,6 +24,8 @@ headers = {
     "Content-Type": "application/json"
 }
 
+session = get_session()
+
 def debug_mappings():
     """Debug delle mappature per capire il problema"""
     try:
@@ -41,7 +46,7 @@ def debug_mappings():
         
         print(f"\nControllando se opere esistono in Supabase: {test_opera_ids}")
         for opera_id in test_opera_ids:
-            response = requests.get(
+            response = session.get(
                 f"{supabase_url}/opere",
                 headers=headers,
                 params={"codice_opera": f"eq.{opera_id}", "select": "id,codice_opera,titolo"}
@@ -58,7 +63,7 @@ def debug_mappings():
         
         print(f"\nControllando se artisti esistono in Supabase: {test_artista_ids}")
         for artista_id in test_artista_ids:
-            response = requests.get(
+            response = session.get(
                 f"{supabase_url}/artisti",
                 headers=headers,
                 params={"codice_artista": f"eq.{artista_id}", "select": "id,codice_artista,nome,cognome"}
@@ -1,9 +1,14 @@
 #!/usr/bin/env python3
 import os
 import mysql.connector
-import requests
+import sys
 import json
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.postgrest import get_session
+from common.batching import AdaptiveBatchSize, send_adaptive
+from common.opere_types import SERIES_PREDICATE_SQL, TIPO_SQL, classify_opere
+
 # MySQL connection details
 mysql_config = {
     'host': '86.105.14.112',
@@ -22,6 +27,11 @@ headers = {
     "Content-Type": "application/json"
 }
 
+session = get_session()
+
+# (codice_opera, tipo) pairs per reclassify_opere_tipo call
+RECLASSIFY_BATCH_SIZE = 5000
+
 def analyze_mysql_data():
     """Analyze MySQL data to understand the categorization"""
     try:
@@ -29,7 +39,7 @@ def analyze_mysql_data():
         cursor = conn.cursor(dictionary=True)
         
         # Analyze series vs films
-        cursor.execute("""
+        cursor.execute(f"""
             SELECT 
                 cod_opera,
                 titolo,
@@ -38,15 +48,7 @@ def analyze_mysql_data():
                 episodio,
                 nEpisodio,
                 titoloEpisodio,
-                CASE 
-                    WHEN (stagione IS NOT NULL AND stagione != '') 
-                         OR (nStagione IS NOT NULL AND nStagione > 0)
-                         OR (episodio IS NOT NULL AND episodio != '')
-                         OR (nEpisodio IS NOT NULL AND nEpisodio > 0)
-                         OR (titoloEpisodio IS NOT NULL AND titoloEpisodio != '')
-                    THEN 'serie_tv'
-                    ELSE 'film'
-                END as should_be_type
+                {TIPO_SQL} as should_be_type
             FROM opere 
             ORDER BY cod_opera
             LIMIT 100
@@ -75,24 +77,10 @@ def analyze_mysql_data():
         print(f"Should be film: {film_count}")
         
         # Get total counts
-        cursor.execute("""
+        cursor.execute(f"""
             SELECT 
-                SUM(CASE 
-                    WHEN (stagione IS NOT NULL AND stagione != '') 
-                         OR (nStagione IS NOT NULL AND nStagione > 0)
-                         OR (episodio IS NOT NULL AND episodio != '')
-                         OR (nEpisodio IS NOT NULL AND nEpisodio > 0)
-                         OR (titoloEpisodio IS NOT NULL AND titoloEpisodio != '')
-                    THEN 1 ELSE 0
-                END) as total_series,
-                SUM(CASE 
-                    WHEN NOT ((stagione IS NOT NULL AND stagione != '') 
-                             OR (nStagione IS NOT NULL AND nStagione > 0)
-                             OR (episodio IS NOT NULL AND episodio != '')
-                             OR (nEpisodio IS NOT NULL AND nEpisodio > 0)
-                             OR (titoloEpisodio IS NOT NULL AND titoloEpisodio != ''))
-                    THEN 1 ELSE 0
-                END) as total_films
+                SUM({SERIES_PREDICATE_SQL}) as total_series,
+                SUM(NOT {SERIES_PREDICATE_SQL}) as total_films
             FROM opere
         """)
         
@@ -110,79 +98,84 @@ def analyze_mysql_data():
         print(f"Error: {e}")
         return False
 
+def reclassify_rpc(pairs):
+    """
+    Send (codice_opera, tipo) pairs to the reclassify_opere_tipo RPC, one
+    UPDATE ... FROM unnest per batch (halved on 413/timeout).
+    Returns the number of updated rows, or None if the RPC is not deployed.
+    """
+    sizer = AdaptiveBatchSize(initial=RECLASSIFY_BATCH_SIZE, max_size=RECLASSIFY_BATCH_SIZE)
+    updated = 0
+    i = 0
+    
+    while i < len(pairs):
+        # Current size: after a 413/timeout the next batches stay smaller
+        batch = pairs[i:i + sizer.size]
+        i += len(batch)
+        results = send_adaptive(batch, sizer, lambda chunk: session.post(
+            f"{supabase_url}/rpc/reclassify_opere_tipo",
+            headers=headers,
+            json={
+                "p_codici": [str(cod_opera) for cod_opera, _ in chunk],
+                "p_tipi": [tipo for _, tipo in chunk]
+            }
+        ))
+        
+        for chunk, response, error in results:
+            if response is not None and response.status_code == 404 and "PGRST202" in response.text:
+                return None
+            if error is None:
+                updated += response.json()
+            else:
+                print(f"Error reclassifying {len(chunk)} opere: {error}")
+        
+        print(f"Reclassified {i}/{len(pairs)} opere ({updated} updated, next batch: {sizer.size})")
+    
+    return updated
+
+def reclassify_patch(cod_opere, tipo, batch_size=200):
+    """Fallback without the RPC: one PATCH codice_opera=in.(...) per block of codes"""
+    values = {"tipo": tipo, "dettagli_serie": None} if tipo == "film" else {"tipo": tipo}
+    
+    for i in range(0, len(cod_opere), batch_size):
+        batch = cod_opere[i:i + batch_size]
+        response = session.patch(
+            f"{supabase_url}/opere",
+            headers=headers,
+            params={"codice_opera": f"in.({','.join(str(cod_opera) for cod_opera in batch)})"},
+            json=values
+        )
+        
+        if response.status_code not in [200, 204]:
+            print(f"Error updating {tipo} batch {i//batch_size + 1}: {response.status_code}")
+        
+        print(f"Updated batch {i//batch_size + 1} of {tipo}")
+
 def fix_postgresql_types():
     """Fix the types in PostgreSQL based on correct logic"""
     try:
-        # Connect to MySQL to get the correct categorization
-        conn = mysql.connector.connect(**mysql_config)
-        cursor = conn.cursor(dictionary=True)
-        
+        # Classify the whole catalog in one pass, with the shared predicate
         print("\nFetching MySQL data for correct categorization...")
-        cursor.execute("SELECT * FROM opere ORDER BY cod_opera")
-        opere = cursor.fetchall()
-        
-        print(f"Processing {len(opere)} records...")
-        
-        film_updates = []
-        serie_updates = []
-        
-        for opera in opere:
-            # Correct logic for categorization
-            is_series = (
-                (opera['stagione'] and opera['stagione'].strip() != '') or
-                (opera['nStagione'] and opera['nStagione'] > 0) or
-                (opera['episodio'] and opera['episodio'].strip() != '') or
-                (opera['nEpisodio'] and opera['nEpisodio'] > 0) or
-                (opera['titoloEpisodio'] and opera['titoloEpisodio'].strip() != '')
-            )
-            
-            if is_series:
-                serie_updates.append(opera['cod_opera'])
-            else:
-                film_updates.append(opera['cod_opera'])
+        film_updates, serie_updates = classify_opere(mysql_config)
         
+        print(f"Processing {len(film_updates) + len(serie_updates)} records...")
         print(f"Should be films: {len(film_updates)}")
         print(f"Should be series: {len(serie_updates)}")
         
-        # Update films in batches
-        print("\nUpdating films...")
-        batch_size = 100
-        for i in range(0, len(film_updates), batch_size):
-            batch = film_updates[i:i + batch_size]
-            
-            for cod_opera in batch:
-                response = requests.patch(
-                    f"{supabase_url}/opere",
-                    headers=headers,
-                    params={"codice_opera": f"eq.{cod_opera}"},
-                    json={"tipo": "film", "dettagli_serie": None}
-                )
-                
-                if response.status_code not in [200, 204]:
-                    print(f"Error updating {cod_opera}: {response.status_code}")
-            
-            print(f"Updated batch {i//batch_size + 1} of films")
-        
-        # Update series in batches
-        print("\nUpdating series...")
-        for i in range(0, len(serie_updates), batch_size):
-            batch = serie_updates[i:i + batch_size]
-            
-            for cod_opera in batch:
-                response = requests.patch(
-                    f"{supabase_url}/opere",
-                    headers=headers,
-                    params={"codice_opera": f"eq.{cod_opera}"},
-                    json={"tipo": "serie_tv"}
-                )
-                
-                if response.status_code not in [200, 204]:
-                    print(f"Error updating {cod_opera}: {response.status_code}")
-            
-            print(f"Updated batch {i//batch_size + 1} of series")
-        
-        cursor.close()
-        conn.close()
+        # Bulk path: one UPDATE ... FROM unnest per batch of pairs
+        print("\nReclassifying opere...")
+        pairs = [(cod_opera, "film") for cod_opera in film_updates] + \
+                [(cod_opera, "serie_tv") for cod_opera in serie_updates]
+        updated = reclassify_rpc(pairs)
+        
+        if updated is None:
+            print("RPC reclassify_opere_tipo not available, falling back to PATCH batches")
+            print("\nUpdating films...")
+            reclassify_patch(film_updates, "film")
+            print("\nUpdating series...")
+            reclassify_patch(serie_updates, "serie_tv")
+        else:
+            print(f"Updated {updated} opere (rows already correct are skipped)")
         
         return True
         
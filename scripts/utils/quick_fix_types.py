@@ -1,7 +1,10 @@
 #!/usr/bin/env python3
 import os
-import mysql.connector
-import requests
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.postgrest import get_session, grouped_counts
+from common.opere_types import classify_opere
 
 # MySQL connection details
 mysql_config = {
@@ -21,30 +24,13 @@ headers = {
     "Content-Type": "application/json"
 }
 
+session = get_session()
+
 def get_film_ids():
     """Get IDs that should be films from MySQL"""
     try:
-        conn = mysql.connector.connect(**mysql_config)
-        cursor = conn.cursor()
-        
-        # Get all records that should be films (no significant series data)
-        cursor.execute("""
-            SELECT cod_opera 
-            FROM opere 
-            WHERE NOT (
-                (stagione IS NOT NULL AND stagione != '') 
-                OR (nStagione IS NOT NULL AND nStagione > 0)
-                OR (episodio IS NOT NULL AND episodio != '')
-                OR (nEpisodio IS NOT NULL AND nEpisodio > 0)
-                OR (titoloEpisodio IS NOT NULL AND titoloEpisodio != '')
-            )
-            ORDER BY cod_opera
-        """)
-        
-        film_ids = [row[0] for row in cursor.fetchall()]
-        
-        cursor.close()
-        conn.close()
+        # Same classification as fix_opere_types (no significant series data)
+        film_ids, _ = classify_opere(mysql_config)
         
         print(f"Found {len(film_ids)} records that should be films")
         return film_ids
@@ -66,7 +52,7 @@ def update_films_in_batches(film_ids):
         or_query = ",".join(or_conditions)
         
         try:
-            response = requests.patch(
+            response = session.patch(
                 f"{supabase_url}/opere",
                 headers=headers,
                 params={"or": f"({or_query})"},
@@ -87,28 +73,14 @@ def update_films_in_batches(film_ids):
 def verify_results():
     """Verify the updated types"""
     try:
-        response = requests.get(
-            f"{supabase_url}/opere",
-            headers=headers,
-            params={"select": "tipo", "limit": 50000}
-        )
+        # Counted server-side: one row per tipo, whatever the table size
+        type_counts = dict(grouped_counts("opere.tipo"))
         
-        if response.status_code == 200:
-            records = response.json()
-            
-            type_counts = {}
-            for record in records:
-                tipo = record.get('tipo', 'unknown')
-                type_counts[tipo] = type_counts.get(tipo, 0) + 1
-            
-            print(f"\nFinal type distribution:")
-            for tipo, count in sorted(type_counts.items()):
-                print(f"  {tipo}: {count}")
-            
-            return type_counts
-        else:
-            print(f"Error verifying: {response.status_code}")
-            return {}
+        print(f"\nFinal type distribution:")
+        for tipo, count in sorted(type_counts.items()):
+            print(f"  {tipo}: {count}")
+        
+        return type_counts
             
     except Exception as e:
         print(f"Verification error: {e}")
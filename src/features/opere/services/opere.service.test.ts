@@ -1,5 +1,5 @@
 import { supabase } from '@/shared/lib/supabase-client'
-import { getOpere, getOperaById, createOpera, updateOpera } from './opere.service'
+import { getOpere, getOperaById, createOpera, updateOpera, getDuplicateCodiceOperaMessage } from './opere.service'
 import type { TablesInsert, TablesUpdate } from '@/shared/lib/supabase'
 
 const mockSingle: jest.Mock = jest.fn()
@@ -105,4 +105,22 @@ describe('Opere Service', () => {
       expect(data).toEqual(mockData)
     })
   })
+
+  describe('getDuplicateCodiceOperaMessage', () => {
+    it('should map the codice_opera unique violation to a form message', () => {
+      const error = {
+        code: '23505',
+        message: 'duplicate key value violates unique constraint "idx_opere_codice_opera_unique"',
+        details: 'Key (codice_opera)=(OP001) already exists.',
+      }
+
+      expect(getDuplicateCodiceOperaMessage(error)).toBe('Esiste già un\'opera con questo codice opera')
+    })
+
+    it('should return null for other errors', () => {
+      expect(getDuplicateCodiceOperaMessage({ code: '23505', details: 'Key (imdb_tconst)=(tt1) already exists.' })).toBeNull()
+      expect(getDuplicateCodiceOperaMessage({ code: '42501', message: 'permission denied' })).toBeNull()
+      expect(getDuplicateCodiceOperaMessage(null)).toBeNull()
+    })
+  })
 })
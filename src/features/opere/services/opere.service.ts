@@ -254,6 +254,18 @@ export const updateOpera = async (
   return { data, error }
 }
 
+/**
+ * Maps the unique violation on opere.codice_opera (idx_opere_codice_opera_unique)
+ * to a form message. Returns null for any other error.
+ */
+export const getDuplicateCodiceOperaMessage = (
+  error: { code?: string; message?: string; details?: string } | null | undefined
+) => {
+  if (error?.code !== '23505') return null
+  if (!`${error.message ?? ''} ${error.details ?? ''}`.includes('codice_opera')) return null
+  return 'Esiste già un\'opera con questo codice opera'
+}
+
 /**
  * Counts the number of participations for a given opera.
  * Used to check if an opera can be deleted.
@@ -0,0 +1,72 @@
+-- supabase: no-transaction
+--
+-- Unique keys for idempotent upserts from the MySQL migration scripts.
+-- scripts/migrations/migrate_opere.py and migrate_artists.py --upsert send
+-- on_conflict=codice_opera / codice_artista with resolution=merge-duplicates,
+-- which PostgREST turns into ON CONFLICT (col): that requires a non-partial
+-- unique index on the column. NULL codes remain allowed (NULLs never conflict).
+-- Duplicate codes left by earlier non-idempotent runs must be removed first:
+-- the migration stops with the list of duplicates instead of building the index.
+
+DO $$
+DECLARE
+  v_duplicates text;
+BEGIN
+  SELECT string_agg(format('%s (%s righe)', codice_opera, n), ', ')
+  INTO v_duplicates
+  FROM (
+    SELECT codice_opera, count(*) AS n
+    FROM public.opere
+    WHERE codice_opera IS NOT NULL
+    GROUP BY codice_opera
+    HAVING count(*) > 1
+    ORDER BY codice_opera
+    LIMIT 20
+  ) d;
+
+  IF v_duplicates IS NOT NULL THEN
+    RAISE EXCEPTION 'opere.codice_opera duplicati, impossibile creare idx_opere_codice_opera_unique: %', v_duplicates
+      USING HINT = 'Rimuovere o correggere i duplicati (SELECT codice_opera, count(*) FROM opere GROUP BY 1 HAVING count(*) > 1) e rieseguire la migrazione.';
+  END IF;
+END $$;
+
+-- A failed CONCURRENTLY build leaves an INVALID index that IF NOT EXISTS would
+-- then skip, and ON CONFLICT (codice_opera) cannot use it. Drop it so the next
+-- statement rebuilds it. A conditional DROP INDEX CONCURRENTLY cannot run in a
+-- DO block, so this is a plain DROP: dropping an invalid index is quick.
+DO $$
+BEGIN
+  IF EXISTS (
+    SELECT 1 FROM pg_index i
+    JOIN pg_class c ON c.oid = i.indexrelid
+    JOIN pg_namespace n ON n.oid = c.relnamespace
+    WHERE n.nspname = 'public' AND c.relname = 'idx_opere_codice_opera_unique' AND NOT i.indisvalid
+  ) THEN
+    DROP INDEX public.idx_opere_codice_opera_unique;
+  END IF;
+END $$;
+
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS idx_opere_codice_opera_unique
+  ON public.opere (codice_opera);
+
+-- codice_artista only exists on databases still carrying the legacy artisti
+-- layout used by migrate_artists.py; the table is small, no CONCURRENTLY needed.
+DO $$
+BEGIN
+  IF EXISTS (
+    SELECT 1 FROM information_schema.columns
+    WHERE table_schema = 'public' AND table_name = 'artisti' AND column_name = 'codice_artista'
+  ) THEN
+    IF EXISTS (
+      SELECT 1 FROM public.artisti
+      WHERE codice_artista IS NOT NULL
+      GROUP BY codice_artista
+      HAVING count(*) > 1
+    ) THEN
+      RAISE EXCEPTION 'artisti.codice_artista duplicati, impossibile creare idx_artisti_codice_artista_unique'
+        USING HINT = 'Rimuovere o correggere i duplicati (SELECT codice_artista, count(*) FROM artisti GROUP BY 1 HAVING count(*) > 1) e rieseguire la migrazione.';
+    END IF;
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_artisti_codice_artista_unique
+      ON public.artisti (codice_artista);
+  END IF;
+END $$;
@@ -0,0 +1,9 @@
+-- supabase: no-transaction
+--
+-- Expression index for the staging-id lookups in
+-- scripts/migrations/sync_deletions.py, which fetches partecipazioni with
+-- metadati->>id_opera_staging=in.(...) in chunks. Without it every chunk is a
+-- full scan of partecipazioni with a JSONB extraction per row.
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_partecipazioni_id_opera_staging
+  ON public.partecipazioni ((metadati->>'id_opera_staging'));
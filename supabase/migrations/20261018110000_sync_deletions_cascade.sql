@@ -0,0 +1,50 @@
+-- Server-side cascade for scripts/migrations/sync_deletions.py --execute.
+-- The script used to find partecipazioni by staging id, then their
+-- individuazioni, and delete both through hundreds of small REST calls.
+-- This function does the same set-based, in one transaction: either the whole
+-- cascade is applied or nothing is. Returns the per-table deleted counts.
+
+CREATE OR REPLACE FUNCTION public.sync_deletions_cascade(
+  p_staging_ids bigint[]
+)
+RETURNS jsonb
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public, pg_temp
+AS $function$
+DECLARE
+  v_partecipazioni integer := 0;
+  v_individuazioni integer := 0;
+BEGIN
+  -- metadati->>'id_opera_staging' is text: match on the text form so the
+  -- lookup uses idx_partecipazioni_id_opera_staging
+  CREATE TEMP TABLE _sync_partecipazioni ON COMMIT DROP AS
+  SELECT p.id
+  FROM public.partecipazioni p
+  WHERE p.metadati->>'id_opera_staging' = ANY (
+    SELECT s::text FROM unnest(p_staging_ids) AS s
+  );
+
+  DELETE FROM public.individuazioni i
+  USING _sync_partecipazioni t
+  WHERE i.partecipazione_id = t.id;
+  GET DIAGNOSTICS v_individuazioni = ROW_COUNT;
+
+  DELETE FROM public.partecipazioni p
+  USING _sync_partecipazioni t
+  WHERE p.id = t.id;
+  GET DIAGNOSTICS v_partecipazioni = ROW_COUNT;
+
+  DROP TABLE _sync_partecipazioni;
+
+  RETURN jsonb_build_object(
+    'staging_ids', coalesce(cardinality(p_staging_ids), 0),
+    'individuazioni', v_individuazioni,
+    'partecipazioni', v_partecipazioni
+  );
+END;
+$function$;
+
+REVOKE EXECUTE ON FUNCTION public.sync_deletions_cascade(bigint[]) FROM PUBLIC;
+REVOKE EXECUTE ON FUNCTION public.sync_deletions_cascade(bigint[]) FROM anon, authenticated;
+GRANT EXECUTE ON FUNCTION public.sync_deletions_cascade(bigint[]) TO service_role;
@@ -0,0 +1,23 @@
+-- Distinct staging ids of all partecipazioni, for
+-- scripts/migrations/sync_deletions.py. The script used to page through
+-- partecipazioni selecting the whole metadati document of every row just to
+-- read metadati->>'id_opera_staging'; this returns the deduplicated ids as a
+-- single integer array, so only the ids cross the wire (and the PostgREST
+-- max-rows cap does not apply to the one-row result).
+
+CREATE OR REPLACE FUNCTION public.partecipazioni_staging_ids()
+RETURNS bigint[]
+LANGUAGE sql
+STABLE
+SECURITY DEFINER
+SET search_path = public, pg_temp
+AS $function$
+  SELECT coalesce(array_agg(DISTINCT (p.metadati->>'id_opera_staging')::bigint
+                            ORDER BY (p.metadati->>'id_opera_staging')::bigint), '{}')
+  FROM public.partecipazioni p
+  WHERE p.metadati->>'id_opera_staging' ~ '^[0-9]+$';
+$function$;
+
+REVOKE EXECUTE ON FUNCTION public.partecipazioni_staging_ids() FROM PUBLIC;
+REVOKE EXECUTE ON FUNCTION public.partecipazioni_staging_ids() FROM anon, authenticated;
+GRANT EXECUTE ON FUNCTION public.partecipazioni_staging_ids() TO service_role;
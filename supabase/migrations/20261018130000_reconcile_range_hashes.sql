@@ -0,0 +1,118 @@
+-- Range hashes for scripts/migrations/reconcile.py.
+-- The script compares MySQL and Postgres by hashing key ranges on both sides
+-- and drilling only into ranges whose (row count, hash sum) differ, so two
+-- databases that mostly agree exchange a few aggregates instead of every row.
+--
+-- Each entity is reduced to (key, row_hash): key is the MySQL primary key
+-- stored on the Postgres row, row_hash the first 60 bits of md5 over the
+-- compared columns joined with '|' (NULL as '\N'). reconcile.py builds the
+-- same text in MySQL, so a row hashes identically on both sides. Columns that
+-- later scripts rewrite on purpose (opere.tipo, dettagli_serie, the artisti
+-- name split) are not compared.
+
+CREATE OR REPLACE FUNCTION public.reconcile_rows(p_entity text)
+RETURNS TABLE (key bigint, row_hash bigint)
+LANGUAGE plpgsql
+STABLE
+SECURITY DEFINER
+SET search_path = public, pg_temp
+AS $function$
+BEGIN
+  IF p_entity = 'opere' THEN
+    RETURN QUERY
+    SELECT o.codice_opera::bigint,
+           ('x' || left(md5(concat_ws('|',
+             o.codice_opera,
+             coalesce(o.titolo, '\N'),
+             coalesce(o.titolo_originale, '\N'),
+             coalesce(o.anno_produzione::text, '\N'),
+             coalesce(o.regista[1], '\N'),
+             coalesce(o.codice_isan, '\N'),
+             coalesce(o.casa_produzione, '\N')
+           )), 15))::bit(60)::bigint
+    FROM public.opere o
+    WHERE o.codice_opera ~ '^[0-9]+$';
+
+  ELSIF p_entity = 'artisti' THEN
+    -- codice_artista only exists on the legacy artisti layout (see
+    -- 20261018090000_migration_upsert_unique_keys.sql): dynamic SQL so the
+    -- function still compiles where it is missing
+    RETURN QUERY EXECUTE $sql$
+    SELECT a.codice_artista::bigint,
+           ('x' || left(md5(concat_ws('|',
+             a.codice_artista::text,
+             coalesce(a.codice_fiscale, '\N'),
+             coalesce(a.data_nascita::text, '\N'),
+             coalesce(a.imdb_nconst, '\N')
+           )), 15))::bit(60)::bigint
+    FROM public.artisti a
+    WHERE a.codice_artista::text ~ '^[0-9]+$'
+    $sql$;
+
+  ELSIF p_entity = 'partecipazioni' THEN
+    -- Keyed by opera code: one row per (artista, ruolo MySQL) of the opera
+    RETURN QUERY EXECUTE $sql$
+    SELECT o.codice_opera::bigint,
+           ('x' || left(md5(concat_ws('|',
+             o.codice_opera,
+             a.codice_artista::text,
+             coalesce(substring(p.note FROM '^Ruolo MySQL: (.*)$'), '\N')
+           )), 15))::bit(60)::bigint
+    FROM public.partecipazioni p
+    JOIN public.opere o ON o.id = p.opera_id
+    JOIN public.artisti a ON a.id = p.artista_id
+    WHERE o.codice_opera ~ '^[0-9]+$'
+      AND a.codice_artista IS NOT NULL
+    $sql$;
+
+  ELSE
+    RAISE EXCEPTION 'reconcile_rows: entità sconosciuta %', p_entity;
+  END IF;
+END;
+$function$;
+
+-- Row count, hash sum and key bounds per bucket [p_bounds[i], p_bounds[i+1]).
+-- Buckets are numbered like width_bucket (1-based); rows outside
+-- [p_bounds[1], p_bounds[n]) are ignored.
+CREATE OR REPLACE FUNCTION public.reconcile_range_hashes(p_entity text, p_bounds bigint[])
+RETURNS TABLE (bucket integer, row_count bigint, hash_sum numeric, min_key bigint, max_key bigint)
+LANGUAGE sql
+STABLE
+SECURITY DEFINER
+SET search_path = public, pg_temp
+AS $function$
+  SELECT width_bucket(r.key, p_bounds), count(*), sum(r.row_hash), min(r.key), max(r.key)
+  FROM public.reconcile_rows(p_entity) r
+  WHERE r.key >= p_bounds[1]
+    AND r.key < p_bounds[cardinality(p_bounds)]
+  GROUP BY 1;
+$function$;
+
+-- Individual (key, row_hash) rows of the ranges [p_ranges[2i-1], p_ranges[2i]).
+CREATE OR REPLACE FUNCTION public.reconcile_range_rows(p_entity text, p_ranges bigint[])
+RETURNS TABLE (key bigint, row_hash bigint)
+LANGUAGE sql
+STABLE
+SECURITY DEFINER
+SET search_path = public, pg_temp
+AS $function$
+  SELECT r.key, r.row_hash
+  FROM public.reconcile_rows(p_entity) r
+  WHERE EXISTS (
+    SELECT 1
+    FROM generate_series(1, cardinality(p_ranges) / 2) AS i
+    WHERE r.key >= p_ranges[2 * i - 1]
+      AND r.key < p_ranges[2 * i]
+  )
+  ORDER BY r.key, r.row_hash;
+$function$;
+
+REVOKE EXECUTE ON FUNCTION public.reconcile_rows(text) FROM PUBLIC;
+REVOKE EXECUTE ON FUNCTION public.reconcile_rows(text) FROM anon, authenticated;
+REVOKE EXECUTE ON FUNCTION public.reconcile_range_hashes(text, bigint[]) FROM PUBLIC;
+REVOKE EXECUTE ON FUNCTION public.reconcile_range_hashes(text, bigint[]) FROM anon, authenticated;
+REVOKE EXECUTE ON FUNCTION public.reconcile_range_rows(text, bigint[]) FROM PUBLIC;
+REVOKE EXECUTE ON FUNCTION public.reconcile_range_rows(text, bigint[]) FROM anon, authenticated;
+GRANT EXECUTE ON FUNCTION public.reconcile_rows(text) TO service_role;
+GRANT EXECUTE ON FUNCTION public.reconcile_range_hashes(text, bigint[]) TO service_role;
+GRANT EXECUTE ON FUNCTION public.reconcile_range_rows(text, bigint[]) TO service_role;
@@ -0,0 +1,36 @@
+-- supabase: no-transaction
+--
+-- Keyset pages of distinct staging ids in numeric order, for the streaming
+-- merge-join mode of scripts/migrations/sync_deletions.py (--stream). The
+-- script walks these pages alongside MySQL's SELECT id_opera ... ORDER BY
+-- id_opera, so neither side is ever held in memory.
+--
+-- The text expression index from 20261018100000 sorts '10' before '9'; this
+-- partial index orders by the bigint value. The WHERE clause keeps the cast
+-- from failing on non-numeric values.
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_partecipazioni_id_opera_staging_num
+  ON public.partecipazioni (((metadati->>'id_opera_staging')::bigint))
+  WHERE metadati->>'id_opera_staging' ~ '^[0-9]+$';
+
+CREATE OR REPLACE FUNCTION public.partecipazioni_staging_ids_page(
+  p_after bigint DEFAULT NULL,
+  p_limit integer DEFAULT 10000
+)
+RETURNS SETOF bigint
+LANGUAGE sql
+STABLE
+SECURITY DEFINER
+SET search_path = public, pg_temp
+AS $function$
+  SELECT DISTINCT (p.metadati->>'id_opera_staging')::bigint AS staging_id
+  FROM public.partecipazioni p
+  WHERE p.metadati->>'id_opera_staging' ~ '^[0-9]+$'
+    AND (p_after IS NULL OR (p.metadati->>'id_opera_staging')::bigint > p_after)
+  ORDER BY staging_id
+  LIMIT p_limit;
+$function$;
+
+REVOKE EXECUTE ON FUNCTION public.partecipazioni_staging_ids_page(bigint, integer) FROM PUBLIC;
+REVOKE EXECUTE ON FUNCTION public.partecipazioni_staging_ids_page(bigint, integer) FROM anon, authenticated;
+GRANT EXECUTE ON FUNCTION public.partecipazioni_staging_ids_page(bigint, integer) TO service_role;
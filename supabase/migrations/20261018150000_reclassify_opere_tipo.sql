@@ -0,0 +1,40 @@
+-- Bulk film / serie_tv reclassification for scripts/utils/fix_opere_types.py.
+-- The script used to send one PATCH opere?codice_opera=eq.X per opera; it now
+-- uploads (codice_opera, tipo) pairs in large batches and this function
+-- applies each batch as a single UPDATE ... FROM unnest(...).
+-- Films also lose dettagli_serie, as the per-row PATCH did. Rows already
+-- correct are skipped, so reruns write nothing.
+
+CREATE OR REPLACE FUNCTION public.reclassify_opere_tipo(
+  p_codici text[],
+  p_tipi text[]
+)
+RETURNS integer
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public, pg_temp
+AS $function$
+DECLARE
+  v_updated integer := 0;
+BEGIN
+  IF cardinality(p_codici) IS DISTINCT FROM cardinality(p_tipi) THEN
+    RAISE EXCEPTION 'reclassify_opere_tipo: % codici ma % tipi',
+      cardinality(p_codici), cardinality(p_tipi);
+  END IF;
+
+  UPDATE public.opere o
+  SET tipo = u.tipo::public.tipo_opera,
+      dettagli_serie = CASE WHEN u.tipo = 'film' THEN NULL ELSE o.dettagli_serie END
+  FROM unnest(p_codici, p_tipi) AS u(codice_opera, tipo)
+  WHERE o.codice_opera = u.codice_opera
+    AND (o.tipo IS DISTINCT FROM u.tipo::public.tipo_opera
+         OR (u.tipo = 'film' AND o.dettagli_serie IS NOT NULL));
+  GET DIAGNOSTICS v_updated = ROW_COUNT;
+
+  RETURN v_updated;
+END;
+$function$;
+
+REVOKE EXECUTE ON FUNCTION public.reclassify_opere_tipo(text[], text[]) FROM PUBLIC;
+REVOKE EXECUTE ON FUNCTION public.reclassify_opere_tipo(text[], text[]) FROM anon, authenticated;
+GRANT EXECUTE ON FUNCTION public.reclassify_opere_tipo(text[], text[]) TO service_role;
@@ -0,0 +1,59 @@
+-- Grouped counts for the Python check scripts (scripts/checks, scripts/utils).
+-- They used to download up to 50,000 rows just to count values in Python,
+-- which moved megabytes and silently undercounted once a table outgrew the
+-- hard-coded limit. This returns one (value, row_count) row per group, largest
+-- first, optionally only the top p_limit groups.
+
+CREATE OR REPLACE FUNCTION public.grouped_counts(
+  p_dimension text,
+  p_limit integer DEFAULT NULL
+)
+RETURNS TABLE (value text, row_count bigint)
+LANGUAGE plpgsql
+STABLE
+SECURITY DEFINER
+SET search_path = public, pg_temp
+AS $function$
+BEGIN
+  IF p_dimension = 'opere.tipo' THEN
+    RETURN QUERY
+    SELECT o.tipo::text, count(*)
+    FROM public.opere o
+    GROUP BY 1 ORDER BY 2 DESC, 1 LIMIT p_limit;
+
+  ELSIF p_dimension = 'partecipazioni.ruolo' THEN
+    RETURN QUERY
+    SELECT coalesce(r.nome, 'Sconosciuto'), count(*)
+    FROM public.partecipazioni p
+    LEFT JOIN public.ruoli_tipologie r ON r.id = p.ruolo_id
+    GROUP BY 1 ORDER BY 2 DESC, 1 LIMIT p_limit;
+
+  ELSIF p_dimension = 'partecipazioni.stato_validazione' THEN
+    RETURN QUERY
+    SELECT p.stato_validazione::text, count(*)
+    FROM public.partecipazioni p
+    GROUP BY 1 ORDER BY 2 DESC, 1 LIMIT p_limit;
+
+  ELSIF p_dimension = 'partecipazioni.opera' THEN
+    RETURN QUERY
+    SELECT coalesce(o.titolo, 'N/A'), count(*)
+    FROM public.partecipazioni p
+    LEFT JOIN public.opere o ON o.id = p.opera_id
+    GROUP BY p.opera_id, o.titolo ORDER BY 2 DESC, 1 LIMIT p_limit;
+
+  ELSIF p_dimension = 'individuazioni.emittente' THEN
+    RETURN QUERY
+    SELECT coalesce(e.nome, i.emittente, 'Sconosciuta'), count(*)
+    FROM public.individuazioni i
+    LEFT JOIN public.emittenti e ON e.id = i.emittente_id
+    GROUP BY 1 ORDER BY 2 DESC, 1 LIMIT p_limit;
+
+  ELSE
+    RAISE EXCEPTION 'grouped_counts: dimensione sconosciuta %', p_dimension;
+  END IF;
+END;
+$function$;
+
+REVOKE EXECUTE ON FUNCTION public.grouped_counts(text, integer) FROM PUBLIC;
+REVOKE EXECUTE ON FUNCTION public.grouped_counts(text, integer) FROM anon, authenticated;
+GRANT EXECUTE ON FUNCTION public.grouped_counts(text, integer) TO service_role;
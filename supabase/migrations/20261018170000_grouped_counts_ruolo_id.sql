@@ -0,0 +1,66 @@
+-- grouped_counts: add the partecipazioni.ruolo_id dimension for
+-- scripts/checks/check_full_integrity.py, which used to issue one count=exact
+-- request (a full count scan of partecipazioni) per role plus one for NULL
+-- roles. Grouping by ruolo_id returns every role's count, NULL included, in a
+-- single scan. The other dimensions are unchanged.
+
+CREATE OR REPLACE FUNCTION public.grouped_counts(
+  p_dimension text,
+  p_limit integer DEFAULT NULL
+)
+RETURNS TABLE (value text, row_count bigint)
+LANGUAGE plpgsql
+STABLE
+SECURITY DEFINER
+SET search_path = public, pg_temp
+AS $function$
+BEGIN
+  IF p_dimension = 'opere.tipo' THEN
+    RETURN QUERY
+    SELECT o.tipo::text, count(*)
+    FROM public.opere o
+    GROUP BY 1 ORDER BY 2 DESC, 1 LIMIT p_limit;
+
+  ELSIF p_dimension = 'partecipazioni.ruolo' THEN
+    RETURN QUERY
+    SELECT coalesce(r.nome, 'Sconosciuto'), count(*)
+    FROM public.partecipazioni p
+    LEFT JOIN public.ruoli_tipologie r ON r.id = p.ruolo_id
+    GROUP BY 1 ORDER BY 2 DESC, 1 LIMIT p_limit;
+
+  ELSIF p_dimension = 'partecipazioni.ruolo_id' THEN
+    -- By role id, NULL roles kept as a NULL value: every role in one scan
+    RETURN QUERY
+    SELECT p.ruolo_id::text, count(*)
+    FROM public.partecipazioni p
+    GROUP BY 1 ORDER BY 2 DESC, 1 LIMIT p_limit;
+
+  ELSIF p_dimension = 'partecipazioni.stato_validazione' THEN
+    RETURN QUERY
+    SELECT p.stato_validazione::text, count(*)
+    FROM public.partecipazioni p
+    GROUP BY 1 ORDER BY 2 DESC, 1 LIMIT p_limit;
+
+  ELSIF p_dimension = 'partecipazioni.opera' THEN
+    RETURN QUERY
+    SELECT coalesce(o.titolo, 'N/A'), count(*)
+    FROM public.partecipazioni p
+    LEFT JOIN public.opere o ON o.id = p.opera_id
+    GROUP BY p.opera_id, o.titolo ORDER BY 2 DESC, 1 LIMIT p_limit;
+
+  ELSIF p_dimension = 'individuazioni.emittente' THEN
+    RETURN QUERY
+    SELECT coalesce(e.nome, i.emittente, 'Sconosciuta'), count(*)
+    FROM public.individuazioni i
+    LEFT JOIN public.emittenti e ON e.id = i.emittente_id
+    GROUP BY 1 ORDER BY 2 DESC, 1 LIMIT p_limit;
+
+  ELSE
+    RAISE EXCEPTION 'grouped_counts: dimensione sconosciuta %', p_dimension;
+  END IF;
+END;
+$function$;
+
+REVOKE EXECUTE ON FUNCTION public.grouped_counts(text, integer) FROM PUBLIC;
+REVOKE EXECUTE ON FUNCTION public.grouped_counts(text, integer) FROM anon, authenticated;
+GRANT EXECUTE ON FUNCTION public.grouped_counts(text, integer) TO service_role;
@@ -0,0 +1,16 @@
+-- supabase: no-transaction
+--
+-- Conflict key for the resumable partecipazioni load in
+-- scripts/migrations/migrate_partecipazioni.py. The table constraint
+-- UNIQUE(artista_id, opera_id, episodio_id, ruolo_id) never fires for film
+-- partecipazioni, where episodio_id is NULL, so a --resume that resends
+-- already acknowledged batches duplicated them. With NULLS NOT DISTINCT the
+-- same key is enforced for NULL episodes too, and the script inserts with
+-- ON CONFLICT (artista_id, opera_id, episodio_id, ruolo_id) DO NOTHING.
+--
+-- Existing duplicates make the build fail; list them with
+--   SELECT artista_id, opera_id, episodio_id, ruolo_id, count(*)
+--   FROM partecipazioni GROUP BY 1, 2, 3, 4 HAVING count(*) > 1;
+
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS uq_partecipazioni_natural_key
+  ON public.partecipazioni (artista_id, opera_id, episodio_id, ruolo_id) NULLS NOT DISTINCT;
@@ -0,0 +1,151 @@
+-- supabase: no-transaction
+--
+-- Push the key range down into the reconciliation RPCs of
+-- scripts/migrations/reconcile.py.
+--
+-- reconcile_rows(p_entity) from 20261018130000 is a plpgsql RETURN QUERY:
+-- the planner cannot see through it, so every reconcile_range_hashes and
+-- reconcile_range_rows call built and md5-hashed the whole entity (a 3-table
+-- join for partecipazioni) before filtering on the key. reconcile_rows now
+-- takes [p_lo, p_hi) and filters on the numeric code inside each branch,
+-- through expression indexes on reconcile_key(code).
+--
+-- reconcile_range_hashes now takes the ranges themselves as pairs, like
+-- reconcile_range_rows, and returns one row per range (bucket = range number).
+-- The old sorted-bounds form also returned the gap buckets between
+-- non-adjacent ranges, which pushed a 1000-range chunk past PostgREST's
+-- max_rows and made truncated buckets look empty. Each range is scanned on its
+-- own, so rows in the gaps are never read.
+
+-- Numeric value of a code column, NULL for non-numeric codes. Inlined by the
+-- planner, so the expression indexes below match the reconcile_rows filters.
+CREATE OR REPLACE FUNCTION public.reconcile_key(p_code text)
+RETURNS bigint
+LANGUAGE sql
+IMMUTABLE
+PARALLEL SAFE
+AS $function$
+  SELECT CASE WHEN p_code ~ '^[0-9]{1,18}$' THEN p_code::bigint END;
+$function$;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_opere_reconcile_key
+  ON public.opere (public.reconcile_key(codice_opera));
+
+-- codice_artista only exists on the legacy artisti layout (see
+-- 20261018090000_migration_upsert_unique_keys.sql); the table is small, no
+-- CONCURRENTLY needed.
+DO $$
+BEGIN
+  IF EXISTS (
+    SELECT 1 FROM information_schema.columns
+    WHERE table_schema = 'public' AND table_name = 'artisti' AND column_name = 'codice_artista'
+  ) THEN
+    CREATE INDEX IF NOT EXISTS idx_artisti_reconcile_key
+      ON public.artisti (public.reconcile_key(codice_artista::text));
+  END IF;
+END $$;
+
+DROP FUNCTION IF EXISTS public.reconcile_range_hashes(text, bigint[]);
+DROP FUNCTION IF EXISTS public.reconcile_rows(text);
+
+CREATE OR REPLACE FUNCTION public.reconcile_rows(p_entity text, p_lo bigint, p_hi bigint)
+RETURNS TABLE (key bigint, row_hash bigint)
+LANGUAGE plpgsql
+STABLE
+SECURITY DEFINER
+SET search_path = public, pg_temp
+AS $function$
+BEGIN
+  IF p_entity = 'opere' THEN
+    RETURN QUERY
+    SELECT public.reconcile_key(o.codice_opera),
+           ('x' || left(md5(concat_ws('|',
+             o.codice_opera,
+             coalesce(o.titolo, '\N'),
+             coalesce(o.titolo_originale, '\N'),
+             coalesce(o.anno_produzione::text, '\N'),
+             coalesce(o.regista[1], '\N'),
+             coalesce(o.codice_isan, '\N'),
+             coalesce(o.casa_produzione, '\N')
+           )), 15))::bit(60)::bigint
+    FROM public.opere o
+    WHERE public.reconcile_key(o.codice_opera) >= p_lo
+      AND public.reconcile_key(o.codice_opera) < p_hi;
+
+  ELSIF p_entity = 'artisti' THEN
+    -- Dynamic SQL so the function still compiles where codice_artista is missing
+    RETURN QUERY EXECUTE $sql$
+    SELECT public.reconcile_key(a.codice_artista::text),
+           ('x' || left(md5(concat_ws('|',
+             a.codice_artista::text,
+             coalesce(a.codice_fiscale, '\N'),
+             coalesce(a.data_nascita::text, '\N'),
+             coalesce(a.imdb_nconst, '\N')
+           )), 15))::bit(60)::bigint
+    FROM public.artisti a
+    WHERE public.reconcile_key(a.codice_artista::text) >= $1
+      AND public.reconcile_key(a.codice_artista::text) < $2
+    $sql$ USING p_lo, p_hi;
+
+  ELSIF p_entity = 'partecipazioni' THEN
+    -- Keyed by opera code: the range selects opere by index, then their
+    -- partecipazioni through partecipazioni(opera_id)
+    RETURN QUERY EXECUTE $sql$
+    SELECT public.reconcile_key(o.codice_opera),
+           ('x' || left(md5(concat_ws('|',
+             o.codice_opera,
+             a.codice_artista::text,
+             coalesce(substring(p.note FROM '^Ruolo MySQL: (.*)$'), '\N')
+           )), 15))::bit(60)::bigint
+    FROM public.opere o
+    JOIN public.partecipazioni p ON p.opera_id = o.id
+    JOIN public.artisti a ON a.id = p.artista_id
+    WHERE public.reconcile_key(o.codice_opera) >= $1
+      AND public.reconcile_key(o.codice_opera) < $2
+      AND a.codice_artista IS NOT NULL
+    $sql$ USING p_lo, p_hi;
+
+  ELSE
+    RAISE EXCEPTION 'reconcile_rows: entità sconosciuta %', p_entity;
+  END IF;
+END;
+$function$;
+
+-- Row count, hash sum and key bounds of each range [p_ranges[2i-1], p_ranges[2i]),
+-- as bucket i. Empty ranges return no row.
+CREATE OR REPLACE FUNCTION public.reconcile_range_hashes(p_entity text, p_ranges bigint[])
+RETURNS TABLE (bucket integer, row_count bigint, hash_sum numeric, min_key bigint, max_key bigint)
+LANGUAGE sql
+STABLE
+SECURITY DEFINER
+SET search_path = public, pg_temp
+AS $function$
+  SELECT i, count(*), sum(r.row_hash), min(r.key), max(r.key)
+  FROM generate_series(1, cardinality(p_ranges) / 2) AS i
+  CROSS JOIN LATERAL public.reconcile_rows(p_entity, p_ranges[2 * i - 1], p_ranges[2 * i]) r
+  GROUP BY i;
+$function$;
+
+-- Individual (key, row_hash) rows of the ranges [p_ranges[2i-1], p_ranges[2i]).
+CREATE OR REPLACE FUNCTION public.reconcile_range_rows(p_entity text, p_ranges bigint[])
+RETURNS TABLE (key bigint, row_hash bigint)
+LANGUAGE sql
+STABLE
+SECURITY DEFINER
+SET search_path = public, pg_temp
+AS $function$
+  SELECT r.key, r.row_hash
+  FROM generate_series(1, cardinality(p_ranges) / 2) AS i
+  CROSS JOIN LATERAL public.reconcile_rows(p_entity, p_ranges[2 * i - 1], p_ranges[2 * i]) r
+  ORDER BY r.key, r.row_hash;
+$function$;
+
+REVOKE EXECUTE ON FUNCTION public.reconcile_rows(text, bigint, bigint) FROM PUBLIC;
+REVOKE EXECUTE ON FUNCTION public.reconcile_rows(text, bigint, bigint) FROM anon, authenticated;
+REVOKE EXECUTE ON FUNCTION public.reconcile_range_hashes(text, bigint[]) FROM PUBLIC;
+REVOKE EXECUTE ON FUNCTION public.reconcile_range_hashes(text, bigint[]) FROM anon, authenticated;
+REVOKE EXECUTE ON FUNCTION public.reconcile_range_rows(text, bigint[]) FROM PUBLIC;
+REVOKE EXECUTE ON FUNCTION public.reconcile_range_rows(text, bigint[]) FROM anon, authenticated;
+GRANT EXECUTE ON FUNCTION public.reconcile_rows(text, bigint, bigint) TO service_role;
+GRANT EXECUTE ON FUNCTION public.reconcile_range_hashes(text, bigint[]) TO service_role;
+GRANT EXECUTE ON FUNCTION public.reconcile_range_rows(text, bigint[]) TO service_role;